@@ -0,0 +1,172 @@
+import numpy as np
+import argparse
+
+from commands import *
+import compiler
+import telemetry
+
+# Samples moving slower than this (mm/s) count as the arm standing still
+stall_speed = 1
+
+# Every move of the program as a segment from the previous point, with
+# the queue index it ran under, the stroke it belongs to (-1 for travel)
+# and the speed it was commanded at
+def programSegments(commands, queueIndices):
+    rows = []
+    position = None
+    velocity = default_velocity
+    pumpOn = False
+    stroke = -1
+
+    for i in range(len(commands)):
+        c = commands[i]
+
+        if type(c) == PumpOn:
+            pumpOn = True
+            stroke += 1
+        elif type(c) == PumpOff or type(c) == PumpDisable:
+            pumpOn = False
+        elif type(c) == Feedrate:
+            velocity = c.velocity
+        elif type(c) == Move or type(c) == Jump:
+            target = (c.x, c.y, c.z)
+            if position is not None:
+                rows.append((i, queueIndices[i], position, target, stroke if pumpOn else -1, velocity))
+            position = target
+
+    return {
+        "command": np.array([r[0] for r in rows], dtype=int),
+        "queue": np.array([r[1] for r in rows], dtype="<u8"),
+        "start": np.array([r[2] for r in rows], dtype=float).reshape(-1, 3),
+        "end": np.array([r[3] for r in rows], dtype=float).reshape(-1, 3),
+        "stroke": np.array([r[4] for r in rows], dtype=int),
+        "velocity": np.array([r[5] for r in rows], dtype=float),
+    }
+
+# Match pose samples to the segments they were taken on and measure how
+# far the arm strayed from each commanded line, how long it spent on it
+# and how fast it really went
+def analyze(commands, queueIndices, samples):
+    seg = programSegments(commands, queueIndices)
+    count = len(seg["queue"])
+
+    # The queue index the arm reports is the last command it finished, so
+    # a sample was taken while it ran the first command after that one. It
+    # belongs to a segment if that command is a move.
+    running = np.searchsorted(np.asarray(queueIndices, dtype="<u8"), samples["index"], side="right")
+    pos = np.searchsorted(seg["command"], running)
+    matched = (pos < count) & (seg["command"][np.minimum(pos, count - 1)] == running)
+    s = pos[matched]
+    t = samples["time"][matched]
+    p = samples["pose"][matched, :3].astype(float)
+
+    a = seg["start"][s]
+    ab = seg["end"][s] - a
+    lengthSq = np.sum(ab * ab, axis=1)
+    along = np.sum((p - a) * ab, axis=1) / np.where(lengthSq > 0, lengthSq, 1)
+
+    closest = a + np.clip(along, 0, 1)[:, None] * ab
+    crossTrack = np.linalg.norm(p - closest, axis=1)
+    overshoot = np.where(along > 1, (along - 1) * np.sqrt(lengthSq), 0)
+
+    # Time between consecutive samples on the same segment
+    period = np.median(np.diff(samples["time"])) if len(samples) > 1 else 0
+    same = np.diff(s) == 0
+    dt = np.diff(t)[same]
+    speed = np.linalg.norm(np.diff(p, axis=0), axis=1)[same] / np.where(dt > 0, dt, 1)
+
+    samplesPer = np.bincount(s, minlength=count)
+    first = np.full(count, np.inf)
+    last = np.full(count, -np.inf)
+    np.minimum.at(first, s, t)
+    np.maximum.at(last, s, t)
+
+    maxCross = np.zeros(count)
+    maxOvershoot = np.zeros(count)
+    np.maximum.at(maxCross, s, crossTrack)
+    np.maximum.at(maxOvershoot, s, overshoot)
+
+    dwell = np.where(samplesPer > 0, last - first + period, 0)
+    length = np.linalg.norm(seg["end"] - seg["start"], axis=1)
+
+    return {
+        "segments": seg,
+        "samples": samplesPer,
+        "dwell": dwell,
+        "length": length,
+        "speed": np.where(dwell > 0, length / np.where(dwell > 0, dwell, 1), 0),
+        "max_cross_track": maxCross,
+        "mean_cross_track": np.bincount(s, weights=crossTrack, minlength=count) / np.maximum(samplesPer, 1),
+        "max_overshoot": maxOvershoot,
+        "stall": np.bincount(s[1:][same], weights=np.where(speed < stall_speed, dt, 0), minlength=count),
+        "unmatched": int(np.sum(~matched)),
+    }
+
+# Per stroke totals, slowest compared to its commanded speed first
+def slowestStrokes(result, top=10):
+    seg = result["segments"]
+    strokes = np.unique(seg["stroke"][seg["stroke"] >= 0])
+    rows = []
+
+    for stroke in strokes:
+        mask = (seg["stroke"] == stroke) & (result["samples"] > 0)
+        if not np.any(mask):
+            continue
+
+        time = np.sum(result["dwell"][mask])
+        length = np.sum(result["length"][mask])
+        commanded = np.sum(result["length"][mask]) / np.sum(result["length"][mask] / seg["velocity"][mask])
+        speed = length / time if time > 0 else 0
+
+        rows.append({
+            "stroke": int(stroke),
+            "command": int(seg["command"][mask][0]),
+            "length": length,
+            "time": time,
+            "speed": speed,
+            "commanded_speed": commanded,
+            "speed_ratio": speed / commanded,
+            "max_cross_track": np.max(result["max_cross_track"][mask]),
+            "stall": np.sum(result["stall"][mask]),
+        })
+
+    rows.sort(key=lambda r: r["speed_ratio"])
+    return rows[:top]
+
+def report(result, top=10):
+    seen = result["samples"] > 0
+    print("Segments with samples: %d of %d (%d samples outside any move)" % (
+        np.sum(seen), len(seen), result["unmatched"]))
+
+    if np.any(seen):
+        print("Cross track error: mean %.2f mm, max %.2f mm" % (
+            np.mean(result["mean_cross_track"][seen]), np.max(result["max_cross_track"])))
+        print("Max overshoot: %.2f mm, total stall time: %.2f s" % (
+            np.max(result["max_overshoot"]), np.sum(result["stall"])))
+
+    print("Slowest strokes:")
+    print("%7s %8s %9s %8s %9s %10s %7s %10s %8s" % (
+        "stroke", "command", "length", "time", "speed", "commanded", "ratio", "max error", "stalled"))
+    for r in slowestStrokes(result, top):
+        print("%7d %8d %7.1fmm %7.2fs %5.1fmm/s %6.1fmm/s %7.2f %8.2fmm %7.2fs" % (
+            r["stroke"], r["command"], r["length"], r["time"], r["speed"], r["commanded_speed"],
+            r["speed_ratio"], r["max_cross_track"], r["stall"]))
+
+if __name__ == "__main__":
+    import main
+
+    parser = argparse.ArgumentParser(description="Compare a recorded pose log with the program that was printed")
+    parser.add_argument("file", help="GCODE file that was printed")
+    parser.add_argument("log", help="pose log recorded with main.py print -t")
+    parser.add_argument("--top", type=int, default=10, help="number of slow strokes to list")
+    parser.add_argument("-f", "--flow", action="store_true", help="the print was run with -f, pump flow control")
+    args = parser.parse_args()
+
+    compiler.flow_control = args.flow
+
+    commands = compiler.compile(main.load_gcode_commands(args.file))
+    queueIndices = telemetry.loadQueueIndices(args.log)
+    if len(queueIndices) != len(commands):
+        print("The pose log was recorded for a different program or compiler settings")
+    else:
+        report(analyze(commands, queueIndices, telemetry.readLog(args.log)), args.top)
@@ -0,0 +1,95 @@
+from dobot import DobotDllType as dType
+import json
+import time
+import os
+
+# Where the last known good state of every arm is kept between jobs
+state_file = os.path.join(os.path.expanduser("~"), ".dobot-pancake", "arms.json")
+
+# Home anyway after this many jobs in a row without homing
+max_jobs_between_homing = 10
+
+# How far the arm may be from the saved pose and still count as unmoved
+pose_tolerance = 1        # mm
+joint_tolerance = 0.5     # degrees
+lost_step_threshold = 5   # degrees
+
+def loadStates():
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def saveState(key, armState):
+    states = loadStates()
+    states[key] = armState
+
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(states, f, indent=2)
+    os.replace(state_file + ".tmp", state_file)
+
+def loadState(key):
+    return loadStates().get(key, {"homed": False, "pose": None, "jobs": 0})
+
+# Identify an arm by the port it is on and its serial number
+def armKey(api, port):
+    return port + ":" + dType.GetDeviceSN(api)[0]
+
+def poseMatches(saved, pose):
+    for i in range(3):
+        if abs(saved[i] - pose[i]) > pose_tolerance:
+            return False
+    for i in range(4, 7):
+        if abs(saved[i] - pose[i]) > joint_tolerance:
+            return False
+
+    return True
+
+# Ask the controller to compare the planned joint angles with its angle
+# sensors. A lost step shows up as an alarm.
+def checkLostSteps(api, timeout=10):
+    dType.ClearAllAlarmsState(api)
+    dType.SetQueuedCmdClear(api)
+    dType.SetLostStepParams(api, lost_step_threshold, isQueued=1)
+    index = dType.SetLostStepCmd(api, isQueued=1)[0]
+    dType.SetQueuedCmdStartExec(api)
+
+    start = time.time()
+    while dType.GetQueuedCmdCurrentIndex(api)[0] < index and time.time() - start < timeout:
+        time.sleep(0.05)
+
+    finished = dType.GetQueuedCmdCurrentIndex(api)[0] >= index
+    dType.SetQueuedCmdStopExec(api)
+    dType.SetQueuedCmdClear(api)
+
+    alarms = dType.GetAlarmsState(api)
+    return finished and not any(alarms[0][:alarms[1]])
+
+# Returns the reason the arm has to be homed, or None if the saved state
+# can be trusted
+def homingReason(api, armState):
+    if not armState["homed"] or armState["pose"] is None:
+        return "no saved home state"
+
+    if armState["jobs"] >= max_jobs_between_homing:
+        return str(armState["jobs"]) + " jobs since last homing"
+
+    if not poseMatches(armState["pose"], dType.GetPose(api)):
+        return "arm moved since the last job"
+
+    if not checkLostSteps(api):
+        return "lost steps detected"
+
+    return None
+
+def markHomed(api, key):
+    saveState(key, {"homed": True, "pose": dType.GetPose(api), "jobs": 0})
+
+# Until a job finishes cleanly the saved pose can't be trusted
+def markJobStarted(key, armState):
+    saveState(key, dict(armState, homed=False))
+
+def markJobFinished(api, key, armState):
+    saveState(key, {"homed": True, "pose": dType.GetPose(api), "jobs": armState["jobs"] + 1})
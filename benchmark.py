@@ -0,0 +1,270 @@
+from dobot import DobotDllType as dType
+from dobot.StubDll import StubDll
+from dobot import DobotInstrument
+from dobot import DobotTrace
+import contextlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import random
+import json
+import math
+import time
+import io
+import os
+
+import main
+import compiler
+import simulator
+
+# Generate PancakePainter style GCODE with roughly `lines` lines
+def generateGcode(lines, seed=0):
+    rand = random.Random(seed)
+
+    gcode = [
+        "; PancakePainter v1.4.0 GCODE",
+        "; Synthetic benchmark design",
+        "G21 ; Set units to MM",
+        "G90 ; Absolute positioning",
+        "G28 X0 Y0 ; Help homing",
+    ]
+
+    while len(gcode) < lines:
+        # Each stroke is a wobbly loop somewhere on the griddle
+        cx = rand.uniform(20, 80)
+        cy = rand.uniform(20, 80)
+        radius = rand.uniform(3, 20)
+        points = rand.randint(10, 60)
+
+        gcode.append("G00 X%.3f Y%.3f F%d" % (cx + radius, cy, rand.choice([1000, 2000, 3000])))
+        gcode.append("M106 ; Pump on")
+        gcode.append("G4 P%d" % rand.choice([100, 150, 200]))
+
+        for i in range(1, points + 1):
+            angle = 2 * math.pi * i / points
+            r = radius * rand.uniform(0.9, 1.1)
+            gcode.append("G00 X%.3f Y%.3f" % (cx + r * math.cos(angle), cy + r * math.sin(angle)))
+
+        gcode.append("M107 ; Pump off")
+        gcode.append("G4 P%d" % rand.choice([50, 100]))
+
+    return "\n".join(gcode[:lines]) + "\n"
+
+# Run a function without its prints and progress bars in the way
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return func(*args, **kwargs)
+
+def benchParse(filename, lines):
+    start = time.perf_counter()
+    commands = quiet(main.load_gcode_commands, filename)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    quiet(main.load_gcode_commands, filename)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return commands, {
+        "seconds": elapsed,
+        "lines_per_second": lines / elapsed,
+        "commands": len(commands),
+        "peak_memory_bytes": peak,
+    }
+
+def benchSubmit(commands, latency=0, instrument=False):
+    main.api = StubDll(latency)
+    if instrument:
+        DobotInstrument.reset()
+        main.api = DobotInstrument.wrapApi(main.api)
+
+    start = time.perf_counter()
+    quiet(main.executeQueue, commands)
+    elapsed = time.perf_counter() - start
+
+    calls = main.api.api.calls if instrument else main.api.calls
+    result = {
+        "seconds": elapsed,
+        "api_calls": calls,
+        "calls_per_second": calls / elapsed,
+        "commands_per_second": len(commands) / elapsed,
+    }
+    if instrument:
+        result["api"] = DobotInstrument.snapshot()
+
+    return result
+
+# Homing as main.py did before it waited on the HOME command's queue
+# index: wait for the pose to stay the same for 15 polls 100 ms apart
+def poseStableHome(api):
+    dType.SetQueuedCmdClear(api)
+    dType.SetHOMEParams(api, 200, 200, 200, 200, 1)
+    dType.SetHOMECmd(api, 0, isQueued=1)
+    dType.SetQueuedCmdStartExec(api)
+
+    counterThresh = 15
+    tCounter = 0
+    lastPose = dType.GetPose(api)
+    while tCounter < counterThresh:
+        if lastPose == dType.GetPose(api):
+            tCounter += 1
+        else:
+            tCounter = 0
+
+        lastPose = dType.GetPose(api)
+        time.sleep(0.1)
+
+    dType.SetQueuedCmdStopExec(api)
+    dType.SetQueuedCmdClear(api)
+
+# How long after the arm finished homing each way of waiting for it
+# notices, against a fake Magician homing `speed` times faster than the
+# arm. The polling intervals are the same whatever the speed.
+def benchHome(speed=5):
+    from dobot.FakeMagician import FakeMagician, home_time
+    from dobot import DobotSerial
+
+    results = {}
+    for name, home in (("pose_stable", poseStableHome), ("queue_index", lambda api: quiet(main.homeRobot))):
+        device = FakeMagician(speed=speed)
+        device.pose[0:3] = [150, 100, 50]
+        main.api = DobotSerial.load()
+        quiet(dType.ConnectDobot, main.api, device.start(), 115200)
+
+        start = time.perf_counter()
+        home(main.api)
+        elapsed = time.perf_counter() - start
+
+        dType.DisconnectDobot(main.api)
+        device.stop()
+
+        results[name] = {
+            "seconds": elapsed,
+            "overshoot_seconds": elapsed - home_time / speed,
+        }
+
+    return results
+
+def benchSimulate(commands):
+    start = time.perf_counter()
+    printTime = simulator.estimateTime(commands)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": elapsed,
+        "simulated_print_seconds": printTime,
+        "simulated_compiled_print_seconds": simulator.estimateTime(compiler.compile(commands)),
+    }
+
+# Reachability precheck over the compiled program
+def benchValidate(commands):
+    compiled = compiler.compile(commands)
+
+    start = time.perf_counter()
+    problems, closest = compiler.checkReach(compiled)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": elapsed,
+        "points_per_second": len(compiler.visitedPoints(compiled)) / elapsed,
+        "unreachable": len(problems),
+    }
+
+# Submit a design against the print phase of a trace recorded with
+# main.py --record, so host side changes are timed against the latency
+# and progress of the real arm
+def benchReplay(trace, filename):
+    main.api = DobotTrace.ReplayDll(trace)
+    main.api.seek("print")
+    commands = compiler.compile(quiet(main.load_gcode_commands, filename))
+
+    start = time.perf_counter()
+    quiet(main.executeQueue, commands)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": elapsed,
+        "recorded_seconds": main.api.phaseTime("print"),
+        "api_calls": main.api.calls,
+        "unrecorded_calls": main.api.missing,
+    }
+
+def runBenchmarks(sizes, latency=0, instrument=False, replay=None):
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for lines in sizes:
+            filename = os.path.join(tmp, "bench_%d.gcode" % lines)
+            with open(filename, "w") as f:
+                f.write(generateGcode(lines))
+
+            commands, parse = benchParse(filename, lines)
+            results[str(lines)] = {
+                "parse": parse,
+                "submit": benchSubmit(commands, latency, instrument),
+                "simulate": benchSimulate(commands),
+                "validate": benchValidate(commands),
+            }
+            print("%7d lines: parse %.2fs, submit %.2fs, simulated print %.1fs" % (
+                lines, parse["seconds"], results[str(lines)]["submit"]["seconds"],
+                results[str(lines)]["simulate"]["simulated_print_seconds"]))
+
+    results["home"] = benchHome()
+    print("Homing noticed %.2fs after the arm finished, %.2fs waiting for the pose to settle" % (
+        results["home"]["queue_index"]["overshoot_seconds"], results["home"]["pose_stable"]["overshoot_seconds"]))
+
+    if replay is not None:
+        results["replay"] = {"replay": benchReplay(*replay)}
+        print("Replayed print %.2fs, recorded %.2fs" % (
+            results["replay"]["replay"]["seconds"], results["replay"]["replay"]["recorded_seconds"]))
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stub_latency": latency,
+            "instrumented": instrument,
+        },
+        "results": results,
+    }
+
+# Print the ratio of every timing in `new` against the same one in `old`
+def compare(old, new):
+    for size, stages in new["results"].items():
+        if size not in old["results"]:
+            continue
+
+        label = size + " lines" if size.isdigit() else size
+        for stage, metrics in stages.items():
+            before = old["results"][size].get(stage, {}).get("seconds")
+            if before:
+                print("%13s %-8s %.3fs -> %.3fs (x%.2f)" % (
+                    label, stage, before, metrics["seconds"], before / metrics["seconds"]))
+
+def benchmark():
+    parser = argparse.ArgumentParser(description="Benchmark GCODE parsing, submission and simulation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--latency", type=float, default=0, help="seconds of fake serial latency per API call")
+    parser.add_argument("--instrument", action="store_true", help="time every DobotDllType call during submission")
+    parser.add_argument("--replay", nargs=2, metavar=("TRACE", "FILE"), help="time printing FILE against a trace recorded with main.py --record")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="earlier JSON output to compare against")
+    args = parser.parse_args()
+
+    if args.instrument:
+        DobotInstrument.enable()
+
+    report = runBenchmarks(args.sizes, args.latency, args.instrument, args.replay)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,52 @@
+import json
+import time
+import os
+
+# How far the last print got, kept until it finishes so an interrupted
+# print can be resumed
+checkpoint_file = os.path.join(os.path.expanduser("~"), ".dobot-pancake", "checkpoint.json")
+
+def load():
+    try:
+        with open(checkpoint_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save(saved):
+    os.makedirs(os.path.dirname(checkpoint_file), exist_ok=True)
+    with open(checkpoint_file + ".tmp", "w") as f:
+        json.dump(saved, f, indent=2)
+    os.replace(checkpoint_file + ".tmp", checkpoint_file)
+
+def clear():
+    try:
+        os.remove(checkpoint_file)
+    except FileNotFoundError:
+        pass
+
+# Records how many commands of the compiled program for filename the arm
+# has confirmed executing. A resumed print runs `prefix` extra commands
+# to get back into position before continuing after command `done`.
+class Checkpoint:
+    def __init__(self, filename, count, done=0, prefix=0):
+        self.filename = os.path.abspath(filename)
+        self.count = count
+        self.done = done
+        self.skipped = done
+        self.prefix = prefix
+
+    # Called by executeQueue with the number of commands executed so far
+    def update(self, executed):
+        done = self.skipped + max(0, executed - self.prefix)
+        if done > self.done:
+            self.done = done
+            save({"file": self.filename, "commands": self.count, "done": done, "time": time.time()})
+
+# Saved checkpoint for filename, or None if there is nothing to resume
+def find(filename):
+    saved = load()
+    if saved is None or saved["file"] != os.path.abspath(filename):
+        return None
+
+    return saved
@@ -0,0 +1,219 @@
+from dobot import DobotDllType as dType
+
+gcode_offset = [-43, 0, 0]
+griddle_home = [150, -25, 35]
+
+# PTP speed used until the GCODE sets a feedrate, and the fastest tool
+# speed a feedrate is allowed to ask for (mm/s and mm/s^2)
+default_velocity = 200
+default_acceleration = 200
+max_velocity = 300
+
+# Joint speed for MOVJ moves (deg/s and deg/s^2)
+joint_velocity = 200
+joint_acceleration = 200
+
+# PWM capable EIO driving the pump motor in flow control mode, and the
+# PWM frequency (Hz). The end effector still switches the pump on and off.
+pump_pwm_address = 4
+pump_pwm_frequency = 1000
+
+class Home:
+    def execute(self, api):
+        return dType.SetHOMECmd(api, 0, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<HOME>"
+
+class PumpOn:
+    def execute(self, api):
+        return dType.SetEndEffectorGripper(api, True, False, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<PUMP_ON>"
+
+class PumpOff:
+    def execute(self, api):
+        return dType.SetEndEffectorGripper(api, True, True, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<PUMP_OFF>"
+
+class PumpDisable:
+    def execute(self, api):
+        return dType.SetEndEffectorGripper(api, True, True, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<PUMP_DISABLE>"
+
+# Switch the pump's EIO over to PWM output
+class PumpFlowSetup:
+    def execute(self, api):
+        return dType.SetIOMultiplexing(api, pump_pwm_address, dType.GPIOType.GPIOTypePWM, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<PUMP_FLOW_SETUP address=" + str(pump_pwm_address) + ">"
+
+# Pump motor duty cycle in percent, sets how fast batter flows
+class PumpFlow:
+    def __init__(self, dutyCycle):
+        self.dutyCycle = dutyCycle
+
+    def execute(self, api):
+        return dType.SetIOPWM(api, pump_pwm_address, pump_pwm_frequency, self.dutyCycle, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<PUMP_FLOW duty=" + str(self.dutyCycle) + ">"
+
+# Moves in a straight line unless mode is set to PTPMOVJXYZMode, which
+# interpolates the joints instead
+class Move:
+    def __init__(self, x, y, z=griddle_home[2]):
+        self.x = griddle_home[0] + x
+        self.y = griddle_home[1] + y
+        self.z = z
+        self.mode = dType.PTPMode.PTPMOVLXYZMode
+
+    def execute(self, api):
+        return dType.SetPTPCmd(api, self.mode, self.x, self.y, self.z, 0, isQueued=1)[0]
+
+    def __repr__(self):
+        if self.mode == dType.PTPMode.PTPMOVJXYZMode:
+            return "<MOVEJ x=" + str(self.x) + " y=" + str(self.y) + ">"
+        return "<MOVE x=" + str(self.x) + " y=" + str(self.y) + ">"
+
+# Move to arm coordinates instead of griddle coordinates
+def MoveTo(x, y, z):
+    move = Move(0, 0, z)
+    move.x = x
+    move.y = y
+    return move
+
+# Hop to arm coordinates with a PTP JUMP: lift, travel and lower in a
+# single queued command. The arm lifts `height` above the higher end
+# point but never above zLimit.
+class Jump:
+    def __init__(self, x, y, z, height, zLimit):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.height = height
+        self.zLimit = zLimit
+
+    def execute(self, api):
+        return dType.SetPTPCmd(api, dType.PTPMode.PTPJUMPXYZMode, self.x, self.y, self.z, 0, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<JUMP x=" + str(self.x) + " y=" + str(self.y) + " z=" + str(self.z) + ">"
+
+class JumpParams:
+    def __init__(self, height, zLimit):
+        self.height = height
+        self.zLimit = zLimit
+
+    def execute(self, api):
+        return dType.SetPTPJumpParams(api, self.height, self.zLimit, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<JUMP_PARAMS height=" + str(self.height) + " zLimit=" + str(self.zLimit) + ">"
+
+# Fixed sequence of arm coordinates (x, y, z) and waits (ms)
+class Macro:
+    steps = []
+
+    def commands(self):
+        return [MoveTo(*s) if type(s) == tuple else Wait(s) for s in self.steps]
+
+    def execute(self, api):
+        toIndex = -1
+        for c in self.commands():
+            toIndex = c.execute(api)
+
+        return toIndex
+
+class UR3(Macro):
+    steps = [
+        (114.4, -91, 42.7),
+        (114.4, -91, -30.7),
+        (138.2, -91, -29.3),
+        1000,
+        (114.4, -91, -30.7),
+        (114.4, -91, 42.7),
+    ]
+
+class PAM(Macro):
+    steps = [
+        (114.4, -91, 42.7),
+        (108.8, -146.5, -26.8),
+        (150, -150, -27),
+        (108.8, -146.5, -26.8),
+        (114.4, -91, 42.7),
+    ]
+
+# Feedrate in mm/min as written in the GCODE
+class Feedrate:
+    def __init__(self, feed, acceleration=default_acceleration):
+        self.feed = feed
+        self.velocity = min(feed / 60, max_velocity)
+        self.acceleration = acceleration
+
+    def execute(self, api):
+        return dType.SetPTPCoordinateParams(api, self.velocity, self.acceleration, self.velocity, self.acceleration, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<FEEDRATE feed=" + str(self.feed) + ">"
+
+class JointSpeed:
+    def __init__(self, velocity=joint_velocity, acceleration=joint_acceleration):
+        self.velocity = velocity
+        self.acceleration = acceleration
+
+    def execute(self, api):
+        v = self.velocity
+        a = self.acceleration
+        return dType.SetPTPJointParams(api, v, a, v, a, v, a, v, a, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<JOINT_SPEED velocity=" + str(self.velocity) + " acceleration=" + str(self.acceleration) + ">"
+
+# Percentage of the PTP velocity and acceleration the arm actually uses
+class SpeedRatio:
+    def __init__(self, velocity=100, acceleration=100):
+        self.velocity = velocity
+        self.acceleration = acceleration
+
+    def execute(self, api):
+        return dType.SetPTPCommonParams(api, self.velocity, self.acceleration, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<SPEED_RATIO velocity=" + str(self.velocity) + " acceleration=" + str(self.acceleration) + ">"
+
+class Wait:
+    def __init__(self, ms):
+        self.ms = ms
+
+    def execute(self, api):
+        return dType.SetWAITCmd(api, self.ms, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<WAIT ms=" + str(self.ms) + ">"
+
+    def __add__(self, other):
+        return Wait(self.ms + other.ms)
+
+    def __radd__(self, other):
+        if other == 0:
+            return self
+        else:
+            return self.__add__(other)
+
+class SetIO:
+    def __init__(self, port, level):
+        self.port = port
+        self.level = level
+
+    def execute(self, api):
+        return dType.SetIODOEx(api, self.port, self.level, isQueued=1)[0]
+
+    def __repr__(self):
+        return "<SETIO port=" + str(self.port) + " level=" + + str(self.level) + ">"
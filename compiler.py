@@ -0,0 +1,587 @@
+from dobot import DobotDllType as dType
+from commands import *
+import kinematics
+import copy
+import math
+
+# Fastest profile the arm can safely travel at with the pump off
+travel_velocity = max_velocity
+travel_acceleration = 400
+
+# Height (mm) to hop over the griddle between strokes, 0 to travel flat
+travel_hop = 0
+
+# Use joint interpolated (MOVJ) moves for travel when the path stays
+# inside the safety envelope: no lower than joint_travel_dip below the
+# lower end point and no further than joint_travel_deviation sideways
+# from the straight line
+joint_travel = True
+joint_travel_dip = 1
+joint_travel_deviation = 25
+envelope_samples = 10
+
+# Batter takes a moment to start and stop flowing, which the GCODE covers
+# with a dwell after turning the pump on or off. Up to pump_lead seconds
+# of the travel into a stroke, and pump_stop_lead seconds of drawing at
+# the end of one, run with the pump already switched in place of the
+# dwell. 0 turns either off.
+pump_lead = 0.5
+pump_stop_lead = 0.1
+
+# Flow control mode drives the pump through PWM and sets the batter flow
+# of every stroke in proportion to the speed it is drawn at, so lines
+# keep their width at any feedrate. flow_reference_duty is the duty cycle
+# (%) that draws the right width at flow_reference_speed (mm/s).
+flow_control = False
+flow_reference_speed = 50
+flow_reference_duty = 40
+flow_min_duty = 10
+flow_max_duty = 100
+
+# How far apart (mm) points can be and still count as the same XY or Z
+xy_tolerance = 0.5
+z_tolerance = 2
+
+def expandMacros(commands):
+    result = []
+    for c in commands:
+        if isinstance(c, Macro):
+            result += c.commands()
+        else:
+            result.append(c)
+
+    return result
+
+# Commands that only change settings, they take no time on the arm
+setting_types = (Feedrate, JointSpeed, JumpParams, SpeedRatio, PumpFlow, PumpFlowSetup)
+
+# Remove work that has no effect on the pancake: consecutive waits become
+# one, zero length moves, PumpOn while the pump is already on and PumpOff
+# right before PumpDisable (the same call) are dropped. The number of
+# commands removed for each reason is added to stats.
+def peephole(commands, stats=None):
+    if stats is None:
+        stats = {}
+    for key in ("waits removed", "moves dropped", "pump on dropped", "pump off dropped"):
+        stats.setdefault(key, 0)
+
+    result = []
+    position = None
+    pumpOn = False
+
+    for i in range(len(commands)):
+        c = commands[i]
+
+        if type(c) == Wait:
+            if c.ms == 0:
+                stats["waits removed"] += 1
+                continue
+            if result and type(result[-1]) == Wait:
+                result[-1] = result[-1] + c
+                stats["waits removed"] += 1
+                continue
+
+        elif type(c) == Move or type(c) == Jump:
+            if (c.x, c.y, c.z) == position:
+                stats["moves dropped"] += 1
+                continue
+            position = (c.x, c.y, c.z)
+
+        elif isinstance(c, Macro):
+            position = endPosition([c], position)
+
+        elif type(c) == PumpOn:
+            if pumpOn:
+                stats["pump on dropped"] += 1
+                continue
+            pumpOn = True
+
+        elif type(c) == PumpOff:
+            # Settings can sit in between, they don't hold up the pump
+            j = i + 1
+            while j < len(commands) and isinstance(commands[j], setting_types):
+                j += 1
+            if j < len(commands) and type(commands[j]) == PumpDisable:
+                stats["pump off dropped"] += 1
+                pumpOn = False
+                continue
+            pumpOn = False
+
+        elif type(c) == PumpDisable:
+            pumpOn = False
+
+        result.append(c)
+
+    return result
+
+def printPeephole(stats):
+    removed = sum(stats.values())
+    if removed:
+        print("Removed", removed, "redundant commands:", ", ".join("%d %s" % (n, k) for k, n in stats.items() if n))
+
+def sameXY(a, b):
+    return abs(a[0] - b[0]) <= xy_tolerance and abs(a[1] - b[1]) <= xy_tolerance
+
+# Lift straight up from position, travel level, then lower straight down
+def isHop(position, lift, traverse, lower):
+    if type(lift) != Move or type(traverse) != Move or type(lower) != Move:
+        return False
+
+    lift = (lift.x, lift.y, lift.z)
+    traverse = (traverse.x, traverse.y, traverse.z)
+    lower = (lower.x, lower.y, lower.z)
+
+    return (sameXY(position, lift) and lift[2] > position[2] + z_tolerance
+        and abs(traverse[2] - lift[2]) <= z_tolerance and not sameXY(lift, traverse)
+        and sameXY(traverse, lower) and lower[2] < traverse[2] - z_tolerance)
+
+# Replace lift, traverse and lower moves made with the pump off by a
+# single JUMP to the final point
+def useJumps(commands):
+    result = []
+    position = None
+    pumpOn = False
+    i = 0
+
+    while i < len(commands):
+        c = commands[i]
+
+        if type(c) == PumpOn:
+            pumpOn = True
+        elif type(c) == PumpOff or type(c) == PumpDisable:
+            pumpOn = False
+        elif not pumpOn and position is not None and i + 2 < len(commands) and isHop(position, *commands[i:i+3]):
+            lift, traverse, lower = commands[i:i+3]
+            top = max(lift.z, traverse.z)
+
+            result.append(Jump(lower.x, lower.y, lower.z, top - max(position[2], lower.z), top))
+            position = (lower.x, lower.y, lower.z)
+            i += 3
+            continue
+
+        if type(c) == Move or type(c) == Jump:
+            position = (c.x, c.y, c.z)
+
+        result.append(c)
+        i += 1
+
+    return result
+
+# Hop over the griddle on every travel move between strokes
+def addTravelHops(commands, height=None):
+    if height is None:
+        height = travel_hop
+    if height <= 0:
+        return commands
+
+    result = []
+    position = None
+    pumpOn = False
+
+    for c in commands:
+        if type(c) == PumpOn:
+            pumpOn = True
+        elif type(c) == PumpOff or type(c) == PumpDisable:
+            pumpOn = False
+        elif type(c) == Move and not pumpOn and position is not None and not sameXY(position, (c.x, c.y)):
+            c = Jump(c.x, c.y, c.z, height, max(position[2], c.z) + height)
+
+        if type(c) == Move or type(c) == Jump:
+            position = (c.x, c.y, c.z)
+
+        result.append(c)
+
+    return result
+
+# Sideways distance of p from the segment a-b in the XY plane
+def distanceFromSegment(p, a, b):
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    length = dx*dx + dy*dy
+    t = 0 if length == 0 else max(0, min(1, ((p[0] - a[0])*dx + (p[1] - a[1])*dy) / length))
+
+    return ((p[0] - a[0] - t*dx)**2 + (p[1] - a[1] - t*dy)**2) ** 0.5
+
+# Check the curved path a MOVJ from start to end takes stays inside the
+# safety envelope
+def jointPathSafe(start, end):
+    a = kinematics.inverse(*start)
+    b = kinematics.inverse(*end)
+    if a is None or b is None or not kinematics.withinLimits(a) or not kinematics.withinLimits(b):
+        return False
+
+    floor = min(start[2], end[2]) - joint_travel_dip
+
+    for i in range(1, envelope_samples):
+        t = i / envelope_samples
+        point = kinematics.forward(*[a[j] + (b[j] - a[j]) * t for j in range(3)])
+
+        if point[2] < floor or distanceFromSegment(point, start, end) > joint_travel_deviation:
+            return False
+
+    return True
+
+# Last arm position a command list leaves the arm at
+def endPosition(commands, start=None):
+    position = start
+    for c in commands:
+        if type(c) == Move or type(c) == Jump:
+            position = (c.x, c.y, c.z)
+        elif isinstance(c, Macro):
+            position = endPosition(c.commands(), position)
+
+    return position
+
+# Travel with the pump off by joint interpolation where it is safe
+def useJointTravel(commands, start=None):
+    if not joint_travel:
+        return commands
+
+    result = []
+    position = start
+    pumpOn = False
+
+    for c in commands:
+        if type(c) == PumpOn:
+            pumpOn = True
+        elif type(c) == PumpOff or type(c) == PumpDisable:
+            pumpOn = False
+        elif type(c) == Move and not pumpOn and position is not None and jointPathSafe(position, (c.x, c.y, c.z)):
+            c = copy.copy(c)
+            c.mode = dType.PTPMode.PTPMOVJXYZMode
+
+        if type(c) == Move or type(c) == Jump:
+            position = (c.x, c.y, c.z)
+        elif isinstance(c, Macro):
+            position = endPosition([c], position)
+
+        result.append(c)
+
+    return result
+
+# Set the joint speed once ahead of the first MOVJ
+def addJointParams(commands):
+    for i in range(len(commands)):
+        c = commands[i]
+        if type(c) == Move and c.mode == dType.PTPMode.PTPMOVJXYZMode:
+            return commands[:i] + [JointSpeed()] + commands[i:]
+
+    return commands
+
+# Queue the jump parameters ahead of every JUMP that needs different ones
+def addJumpParams(commands):
+    result = []
+    active = None
+
+    for c in commands:
+        if type(c) == Jump and (c.height, c.zLimit) != active:
+            active = (c.height, c.zLimit)
+            result.append(JumpParams(c.height, c.zLimit))
+
+        result.append(c)
+
+    return result
+
+# Run moves made with the pump off at the travel profile and switch back
+# to the GCODE feedrate before batter starts flowing again. A speed change
+# is only queued when it differs from the one the arm is already using.
+def addTravelProfile(commands):
+    result = []
+    drawFeed = None
+    activeFeed = None
+    pumpOn = False
+
+    def useFeed(feed):
+        nonlocal activeFeed
+        if activeFeed is None or (feed.velocity, feed.acceleration) != (activeFeed.velocity, activeFeed.acceleration):
+            result.append(feed)
+            activeFeed = feed
+
+    for c in commands:
+        if type(c) == Feedrate:
+            drawFeed = c
+            if pumpOn:
+                useFeed(c)
+            continue
+
+        if type(c) == PumpOn:
+            pumpOn = True
+            if drawFeed is not None:
+                useFeed(drawFeed)
+
+        elif type(c) == PumpOff:
+            pumpOn = False
+
+        # End of the program, hand the arm back at the last requested speed
+        elif type(c) == PumpDisable:
+            pumpOn = False
+            if drawFeed is not None:
+                useFeed(drawFeed)
+
+        elif (type(c) == Move or type(c) == Jump) and not pumpOn:
+            useFeed(Feedrate(travel_velocity * 60, travel_acceleration))
+
+        result.append(c)
+
+    return result
+
+# Moves ending at i that can run while the pump changes state, as the
+# index of the first one and the time they take. Walks back over moves
+# and settings while they fit in `limit` seconds, but not past `earliest`.
+# Moves that are the first after a PumpOn or Wait are kept with the pump
+# as it was.
+def overlapStart(commands, times, i, limit, firstMove, earliest):
+    start = i
+    overlap = 0
+
+    while start > earliest:
+        c = commands[start - 1]
+        if not (isinstance(c, setting_types) or type(c) == Move or type(c) == Jump):
+            break
+        if overlap + times[start - 1] > limit:
+            break
+        if firstMove and type(c) != Move:
+            break
+        if firstMove and not any(type(p) == Move for p in commands[max(start - 2, 0):start - 1]):
+            break
+
+        start -= 1
+        overlap += times[start]
+
+    # Don't leave settings behind the pump change for nothing
+    while start < i and isinstance(commands[start], setting_types):
+        overlap -= times[start]
+        start += 1
+
+    return start, overlap
+
+# Index of the Wait right after i, skipping settings, or None
+def dwellAfter(commands, i):
+    j = i + 1
+    while j < len(commands) and isinstance(commands[j], setting_types):
+        j += 1
+
+    if j < len(commands) and type(commands[j]) == Wait:
+        return j
+    return None
+
+# Switch the pump on during the travel into a stroke and off during the
+# end of it instead of standing still for the dwell that follows. The
+# dwell is shortened by the time overlapped with motion.
+def schedulePump(commands):
+    import simulator
+
+    times = simulator.commandTimes(commands)
+    before = {}
+
+    # Where the arm starts from is unknown, so is how long the first move takes
+    earliest = len(commands)
+    for i in range(len(commands)):
+        if type(commands[i]) == Move or type(commands[i]) == Jump:
+            earliest = i + 1
+            break
+
+    moved = set()
+    waits = {}
+
+    for i in range(len(commands)):
+        c = commands[i]
+        if type(c) == PumpOn:
+            limit = pump_lead
+            firstMove = False
+        elif type(c) == PumpOff:
+            limit = pump_stop_lead
+            firstMove = True
+        else:
+            continue
+
+        dwell = dwellAfter(commands, i)
+        if dwell is None or limit <= 0:
+            continue
+
+        start, overlap = overlapStart(commands, times, i, min(limit, commands[dwell].ms / 1000), firstMove, earliest)
+        if start == i:
+            continue
+
+        before.setdefault(start, []).append(c)
+        moved.add(i)
+        waits[dwell] = round(commands[dwell].ms - overlap * 1000)
+
+    result = []
+    for i in range(len(commands)):
+        result += before.get(i, [])
+        if i in moved:
+            continue
+
+        if i in waits:
+            if waits[i] > 0:
+                result.append(Wait(waits[i]))
+            continue
+
+        result.append(commands[i])
+
+    return result
+
+# Average speed (mm/s) the arm is planned to draw each stroke at, from
+# the PumpOn that starts it, in order. Run it before schedulePump, which
+# moves PumpOn into the travel before the stroke.
+def strokeSpeeds(commands):
+    import simulator
+
+    times = simulator.commandTimes(commands)
+    speeds = []
+    position = None
+    length = None
+    time = 0
+
+    for i in range(len(commands)):
+        c = commands[i]
+
+        if type(c) in (PumpOn, PumpOff, PumpDisable) and length is not None:
+            speeds.append(length / time if time > 0 else flow_reference_speed)
+            length = None
+
+        if type(c) == PumpOn:
+            length = 0
+            time = 0
+
+        if type(c) == Move or type(c) == Jump:
+            target = (c.x, c.y, c.z)
+            if length is not None and position is not None:
+                length += math.dist(position, target)
+                time += times[i]
+            position = target
+
+    if length is not None:
+        speeds.append(length / time if time > 0 else flow_reference_speed)
+
+    return speeds
+
+def flowDuty(speed):
+    duty = flow_reference_duty * speed / flow_reference_speed
+    return round(min(max(duty, flow_min_duty), flow_max_duty), 1)
+
+# Set the pump flow ahead of every stroke and stop it at the end, speeds
+# as returned by strokeSpeeds
+def addFlowControl(commands, speeds):
+    if not flow_control:
+        return commands
+
+    speeds = iter(speeds)
+    result = [PumpFlowSetup()]
+
+    for c in commands:
+        if type(c) == PumpOn:
+            result.append(PumpFlow(flowDuty(next(speeds))))
+
+        result.append(c)
+
+        if type(c) == PumpDisable:
+            result.append(PumpFlow(0))
+
+    return result
+
+# Problems for unreachable points, and the (command index, margin) of the
+# point closest to a joint limit
+def checkReach(commands):
+    reach = reachability(commands)
+    problems = []
+    for i, margin in reach:
+        if margin < 0:
+            problems.append("Point out of range of the dobot: " + repr(commands[i]))
+
+    closest = min(reach, key=lambda r: r[1]) if reach else None
+    return problems, closest
+
+def printReach(commands, problems, closest, limit=10):
+    for p in problems[:limit]:
+        print(p)
+    if len(problems) > limit:
+        print("...and", len(problems) - limit, "more points out of range")
+
+    if closest is not None and closest[1] >= 0:
+        print("Closest to the joint limits: %.1f degrees at %r" % (closest[1], commands[closest[0]]))
+
+# Points every move visits, including the top of each JUMP, as a list of
+# (command index, (x, y, z))
+def visitedPoints(commands):
+    points = []
+    position = None
+
+    for i in range(len(commands)):
+        c = commands[i]
+        if type(c) == Jump and position is not None:
+            top = min(max(position[2], c.z) + c.height, c.zLimit)
+            points.append((i, (position[0], position[1], top)))
+            points.append((i, (c.x, c.y, top)))
+
+        if type(c) == Move or type(c) == Jump:
+            position = (c.x, c.y, c.z)
+            points.append((i, position))
+
+    return points
+
+# Inverse kinematics for every point of the program in one batch. Returns
+# (command index, joint limit margin in degrees) for every point, the
+# margin is negative for points the arm can't reach.
+def reachability(commands):
+    points = visitedPoints(commands)
+    if not points:
+        return []
+
+    margins = kinematics.limitMargin(kinematics.inverseArray([p[1] for p in points]))
+    return list(zip([p[0] for p in points], margins.tolist()))
+
+def compile(commands, stats=None):
+    commands = peephole(commands, stats)
+    commands = useJumps(commands)
+    commands = addTravelHops(commands)
+    commands = useJointTravel(commands)
+    commands = addTravelProfile(commands)
+    commands = addJointParams(commands)
+    commands = addJumpParams(commands)
+    speeds = strokeSpeeds(commands) if flow_control else None
+    commands = schedulePump(commands)
+    return addFlowControl(commands, speeds)
+
+# Macros run at whatever speed the arm is set to, so only their moves
+# are optimized
+def compileMacro(commands):
+    return addJumpParams(useJumps(expandMacros(commands)))
+
+# Move out of the way of the griddle from wherever start is
+def compilePark(park, start=None):
+    return addJointParams(useJointTravel([park], start))
+
+# Height (mm) to hop over the griddle when returning to an interrupted
+# print
+resume_hop = 20
+
+# The rest of a program after its first `done` commands ran, led by a
+# JUMP back to where it stopped with the pump off. The speed settings
+# and pump state the program had at that point are restored before it
+# continues. Returns the commands and how many of them lead in.
+def compileResume(commands, done, start):
+    settings = {}
+    pumpOn = False
+    for c in commands[:done]:
+        if isinstance(c, setting_types):
+            settings[type(c)] = c
+        elif type(c) == PumpOn:
+            pumpOn = True
+        elif type(c) == PumpOff or type(c) == PumpDisable:
+            pumpOn = False
+
+    position = endPosition(commands[:done])
+    if position is None:
+        return commands[done:], 0
+
+    top = max(start[2], position[2]) + resume_hop
+    lead = [PumpOff(), SpeedRatio(), Feedrate(travel_velocity * 60, travel_acceleration)]
+    lead += addJumpParams([Jump(position[0], position[1], position[2], top - max(start[2], position[2]), top)])
+    lead += list(settings.values())
+
+    if pumpOn:
+        lead.append(PumpOn())
+
+    return lead + commands[done:], len(lead)
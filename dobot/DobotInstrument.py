@@ -0,0 +1,157 @@
+import threading
+import inspect
+import time
+
+from dobot import DobotDllType as dType
+
+# Opt-in instrumentation of every DobotDllType wrapper. enable() replaces
+# each wrapper taking an `api` argument with a timed version. The api
+# object the wrappers are called with goes through wrapApi() so the result
+# code of every raw call is seen, whichever backend it comes from. A
+# wrapper that gets an error back from the DLL sleeps and tries again
+# inside its while(True) loop, so every non zero raw result inside a
+# wrapper call is counted as one retry.
+
+# Upper edges of the latency histogram buckets in milliseconds
+buckets = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf")]
+
+class CallStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = float("inf")
+        self.max = 0
+        self.retries = 0
+        self.results = {}
+        self.histogram = [0] * len(buckets)
+
+    def add(self, seconds, retries):
+        ms = seconds * 1000
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.retries += retries
+
+        for i in range(len(buckets)):
+            if ms <= buckets[i]:
+                self.histogram[i] += 1
+                break
+
+    def toDict(self):
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "mean_seconds": self.total / self.count if self.count else 0,
+            "min_seconds": self.min if self.count else 0,
+            "max_seconds": self.max,
+            "retries": self.retries,
+            "results": dict(self.results),
+            "histogram_ms": dict(zip([str(b) for b in buckets], self.histogram)),
+        }
+
+stats = {}
+originals = {}
+lock = threading.Lock()
+
+# Raw DLL calls made by the wrapper currently running on each thread
+local = threading.local()
+
+# Functions called with the name and result of every raw call made
+# through an InstrumentedDll
+hooks = []
+
+def getStats(name):
+    with lock:
+        if name not in stats:
+            stats[name] = CallStats()
+        return stats[name]
+
+# Proxy for the CDLL object that records the result of every raw call
+class InstrumentedDll:
+    def __init__(self, api):
+        self.api = api
+
+    def __getattr__(self, name):
+        func = getattr(self.api, name)
+
+        def call(*args):
+            result = func(*args)
+            for hook in hooks:
+                hook(name, result)
+
+            if isinstance(result, int):
+                s = getStats(name)
+                with lock:
+                    s.results[result] = s.results.get(result, 0) + 1
+                if result != 0 and getattr(local, "retries", None) is not None:
+                    local.retries += 1
+
+            return result
+
+        # Cache so later calls skip __getattr__
+        setattr(self, name, call)
+        return call
+
+def timed(name, func):
+    def wrapper(*args, **kwargs):
+        outer = getattr(local, "retries", None)
+        local.retries = 0
+        start = time.perf_counter()
+
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            retries = local.retries
+            local.retries = outer
+
+            s = getStats(name)
+            with lock:
+                s.add(elapsed, retries)
+
+    wrapper.__name__ = name
+    wrapper.__wrapped__ = func
+    return wrapper
+
+def wrapApi(api):
+    if isinstance(api, InstrumentedDll):
+        return api
+    return InstrumentedDll(api)
+
+def enable():
+    if originals:
+        return
+
+    for name, func in list(vars(dType).items()):
+        if not inspect.isfunction(func) or func.__module__ != dType.__name__:
+            continue
+
+        params = list(inspect.signature(func).parameters)
+        if len(params) > 0 and params[0] == "api":
+            originals[name] = func
+            setattr(dType, name, timed(name, func))
+
+def disable():
+    for name, func in originals.items():
+        setattr(dType, name, func)
+    originals.clear()
+
+def reset():
+    with lock:
+        stats.clear()
+
+def snapshot():
+    with lock:
+        return {name: s.toDict() for name, s in stats.items() if s.count > 0}
+
+def report():
+    calls = snapshot()
+    if not calls:
+        print("No Dobot API calls recorded")
+        return
+
+    print("%-32s %8s %10s %10s %10s %8s" % ("API call", "count", "total s", "mean ms", "max ms", "retries"))
+    for name, s in sorted(calls.items(), key=lambda c: -c[1]["total_seconds"]):
+        print("%-32s %8d %10.3f %10.3f %10.3f %8d" % (
+            name, s["count"], s["total_seconds"], s["mean_seconds"] * 1000, s["max_seconds"] * 1000, s["retries"]))
@@ -0,0 +1,22 @@
+import threading
+
+# The vendor DLL isn't safe to call from several threads at once, and the
+# alarm watchdog and pose recorder call it from their own. Every raw call
+# made through a LockedDll holds `lock`; take it as well to keep a
+# sequence of calls from being interleaved with another thread's.
+lock = threading.RLock()
+
+class LockedDll:
+    def __init__(self, api):
+        self.api = api
+
+    def __getattr__(self, name):
+        func = getattr(self.api, name)
+
+        def call(*args):
+            with lock:
+                return func(*args)
+
+        # Cache so later calls skip __getattr__
+        setattr(self, name, call)
+        return call
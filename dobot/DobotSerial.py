@@ -0,0 +1,386 @@
+from ctypes import *
+import collections
+import threading
+import time
+
+from dobot import DobotDllType as dType
+from dobot.StubDll import CArgObject
+
+# Protocol ID of every DLL call the backend speaks and whether it writes
+# (the rw bit of the control byte). Parameters are the packed structures
+# the DLL is called with, so they go on the wire as they are.
+protocol_ids = {
+    "GetDeviceSN": (0, False),
+    "GetPose": (10, False),
+    "GetAlarmsState": (20, False),
+    "ClearAllAlarmsState": (20, True),
+    "SetHOMEParams": (30, True),
+    "SetHOMECmd": (31, True),
+    "SetEndEffectorParams": (60, True),
+    "SetEndEffectorLaser": (61, True),
+    "SetEndEffectorSuctionCup": (62, True),
+    "SetEndEffectorGripper": (63, True),
+    "SetPTPJointParams": (80, True),
+    "SetPTPCoordinateParams": (81, True),
+    "SetPTPJumpParams": (82, True),
+    "SetPTPCommonParams": (83, True),
+    "SetPTPCmd": (84, True),
+    "SetWAITCmd": (110, True),
+    "SetIOMultiplexing": (130, True),
+    "SetIODO": (131, True),
+    "SetIOPWM": (132, True),
+    "SetLostStepParams": (170, True),
+    "SetLostStepCmd": (171, True),
+    "SetQueuedCmdStartExec": (240, True),
+    "SetQueuedCmdStopExec": (241, True),
+    "SetQueuedCmdForceStopExec": (242, True),
+    "SetQueuedCmdClear": (245, True),
+    "GetQueuedCmdCurrentIndex": (246, False),
+}
+
+queued_left_space_id = 247
+
+# Immediate calls that stop the arm and the pump, still sent once queued
+# commands may have been lost
+stop_ids = [protocol_ids[name][0] for name in ("SetQueuedCmdStopExec", "SetQueuedCmdForceStopExec", "SetEndEffectorGripper", "SetEndEffectorSuctionCup")]
+stop_attempts = 3
+
+# Queued commands are written without waiting for their acknowledgement,
+# up to `window` unacknowledged at a time
+window = 16
+response_timeout = 0.5
+
+class DobotSerialError(Exception):
+    pass
+
+def checksum(payload):
+    return (256 - sum(payload)) & 0xFF
+
+def packet(id, write, queued, params=b""):
+    payload = bytes([id, (1 if write else 0) | (2 if queued else 0)]) + bytes(params)
+    return b"\xaa\xaa" + bytes([len(payload)]) + payload + bytes([checksum(payload)])
+
+# Splits a byte stream into (id, ctrl, params) packets, dropping anything
+# that doesn't frame or checksum
+class PacketReader:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.dropped = 0
+
+    def feed(self, data):
+        self.buffer += data
+        packets = []
+
+        while True:
+            start = self.buffer.find(b"\xaa\xaa")
+            if start < 0:
+                del self.buffer[:max(len(self.buffer) - 1, 0)]
+                return packets
+            del self.buffer[:start]
+
+            if len(self.buffer) < 3:
+                return packets
+            length = self.buffer[2]
+            if len(self.buffer) < 4 + length:
+                return packets
+
+            payload = bytes(self.buffer[3:3 + length])
+            if length < 2 or checksum(payload) != self.buffer[3 + length]:
+                self.dropped += 1
+                del self.buffer[:2]
+                continue
+
+            packets.append((payload[0], payload[1], payload[2:]))
+            del self.buffer[:4 + length]
+
+# Stand-in for the CDLL object returned by dType.load() that talks to the
+# Magician over its serial packet protocol with pyserial. Queued commands
+# are buffered and written together, their queue index is predicted from
+# the last acknowledged one and acknowledgements are matched up by a
+# reader thread. Any call that returns data first waits for everything
+# queued before it. The link is assumed not to lose packets: a queued
+# command that goes unacknowledged or gets a different index than the one
+# handed out makes every later call raise DobotSerialError, except
+# immediate calls that stop the arm or the pump.
+class SerialDll:
+    def __init__(self):
+        self.port = None
+        self.reader = None
+        self.lock = threading.Condition()
+        self.callLock = threading.RLock()
+        self.expected = collections.deque()
+        self.pending = bytearray()
+        self.nextIndex = None
+        self.credits = None
+        self.error = None
+        self.stopping = threading.Event()
+        self.thread = None
+
+        self.packetsSent = 0
+        self.writes = 0
+
+    def __getattr__(self, name):
+        if name not in protocol_ids:
+            raise AttributeError(name + " is not supported by the serial backend")
+
+        id, write = protocol_ids[name]
+
+        # The pose recorder and alarm watchdog call in from their own threads
+        def call(*args):
+            with self.callLock:
+                if write:
+                    return self.set(id, args[2:])
+                return self.get(id, args[2:])
+
+        return call
+
+    def ConnectDobot(self, portName, baudrate, connectInfo):
+        import serial
+
+        try:
+            self.port = serial.Serial(portName.value.decode("utf-8"), baudrate, timeout=0.01)
+        except serial.SerialException:
+            return dType.DobotConnect.DobotConnect_NotFound
+
+        self.reader = PacketReader()
+        self.error = None
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        connectInfo._obj.masterDevInfo.type = dType.DevType.Magician
+        return dType.DobotConnect.DobotConnect_NoError
+
+    def DisconnectDobot(self, masterId):
+        if self.port is None:
+            return
+
+        try:
+            self.drain()
+        except DobotSerialError:
+            pass
+
+        self.stopping.set()
+        self.thread.join()
+        self.port.close()
+        self.port = None
+
+    def run(self):
+        while not self.stopping.is_set():
+            data = self.port.read(self.port.in_waiting or 1)
+            if not data:
+                continue
+
+            for id, ctrl, params in self.reader.feed(data):
+                self.received(id, params)
+
+    def received(self, id, params):
+        with self.lock:
+            if not self.expected or self.expected[0]["id"] != id:
+                # Late answer to a request that already timed out
+                return
+
+            entry = self.expected.popleft()
+            entry["response"] = params
+
+            predicted = entry.get("index")
+            if predicted is not None and int.from_bytes(params[:8], "little") != predicted:
+                self.fail("queued command acknowledged with index %d, expected %d" % (
+                    int.from_bytes(params[:8], "little"), predicted))
+
+            self.lock.notify_all()
+
+    def flush(self):
+        # Queued commands after a lost one would get the wrong index
+        if self.error is not None:
+            self.pending = bytearray()
+        if self.pending:
+            self.port.write(self.pending)
+            self.writes += 1
+            self.pending = bytearray()
+
+    def send(self, data, entry):
+        with self.lock:
+            self.expected.append(entry)
+        self.pending += data
+        self.packetsSent += 1
+
+    def wait(self, entry, timeout=response_timeout):
+        self.flush()
+        deadline = time.perf_counter() + timeout
+
+        with self.lock:
+            while "response" not in entry:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    for i in range(len(self.expected)):
+                        if self.expected[i] is entry:
+                            del self.expected[i]
+                            break
+                    return None
+                self.lock.wait(remaining)
+
+        return entry["response"]
+
+    # Wait for every queued command written so far to be acknowledged
+    def drain(self):
+        self.flush()
+        while True:
+            with self.lock:
+                if not self.expected:
+                    break
+                oldest = self.expected[0]
+
+            if self.wait(oldest) is None:
+                with self.lock:
+                    self.fail("no acknowledgement for a queued command")
+                break
+
+        self.check()
+
+    # Queued commands may have been lost, so forget what was in flight
+    # and find the controller's queue index again. Call with lock held.
+    def fail(self, message):
+        self.error = DobotSerialError(message)
+        self.expected.clear()
+        self.nextIndex = None
+        self.credits = None
+
+    # Once queued commands may have been lost every call fails, whichever
+    # thread makes it, until the port is connected again
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    # Send a request and wait for its answer
+    def request(self, id, write, params=b"", queued=False):
+        self.drain()
+        entry = {"id": id}
+        self.send(packet(id, write, queued, params), entry)
+        return self.wait(entry)
+
+    def leftSpace(self):
+        response = self.request(queued_left_space_id, False)
+        if response is None:
+            return None
+        return int.from_bytes(response[:4], "little")
+
+    def set(self, id, args):
+        queued = len(args) >= 2 and isinstance(args[-1], CArgObject) and type(args[-1]._obj) == c_uint64
+        params = encode(args[:-2] if queued else args)
+
+        if self.error is not None and id in stop_ids and not (queued and args[-2]):
+            return self.stop(id, params)
+        self.check()
+
+        if not (queued and args[-2]):
+            if self.request(id, True, params) is None:
+                return dType.DobotCommunicate.DobotCommunicate_Timeout
+
+            # The controller may start counting again after a clear
+            if id == protocol_ids["SetQueuedCmdClear"][0]:
+                self.nextIndex = None
+                self.credits = None
+            return dType.DobotCommunicate.DobotCommunicate_NoError
+
+        # Don't send more than the controller queue has room for
+        if not self.credits:
+            self.credits = self.leftSpace()
+            if not self.credits:
+                return dType.DobotCommunicate.DobotCommunicate_BufferFull
+
+        # The first queued command tells us where the controller's count is
+        if self.nextIndex is None:
+            response = self.request(id, True, params, True)
+            if response is None:
+                return dType.DobotCommunicate.DobotCommunicate_Timeout
+            args[-1]._obj.value = int.from_bytes(response[:8], "little")
+            self.nextIndex = args[-1]._obj.value + 1
+            self.credits -= 1
+            return dType.DobotCommunicate.DobotCommunicate_NoError
+
+        with self.lock:
+            full = len(self.expected) >= window
+        if full:
+            self.drain()
+
+        args[-1]._obj.value = self.nextIndex
+        self.send(packet(id, True, True, params), {"id": id, "index": self.nextIndex})
+        self.nextIndex += 1
+        self.credits -= 1
+
+        return dType.DobotCommunicate.DobotCommunicate_NoError
+
+    # Send a stop on a link that lost queued commands, without waiting on
+    # them. Raises if a few tries go unanswered, rather than have the
+    # DobotDllType wrapper retry it for ever.
+    def stop(self, id, params):
+        self.flush()
+        for attempt in range(stop_attempts):
+            entry = {"id": id}
+            self.send(packet(id, True, False, params), entry)
+
+            # Written here, flush() would discard it with the queued commands
+            self.port.write(self.pending)
+            self.writes += 1
+            self.pending = bytearray()
+
+            if self.wait(entry) is not None:
+                return dType.DobotCommunicate.DobotCommunicate_NoError
+
+        raise DobotSerialError("no answer to a stop after losing queued commands")
+
+    def get(self, id, args):
+        self.check()
+
+        response = self.request(id, False)
+        if response is None:
+            return dType.DobotCommunicate.DobotCommunicate_Timeout
+
+        decode(response, args)
+        return dType.DobotCommunicate.DobotCommunicate_NoError
+
+    # Queued commands are only written when something needs an answer or
+    # the window fills up, this writes them out now
+    def PeriodicTask(self):
+        self.flush()
+
+# Parameters of a Set call as bytes: structures and ctypes values as
+# packed, plain ints and bools as one byte
+def encode(args):
+    params = b""
+    for a in args:
+        if isinstance(a, CArgObject):
+            params += bytes(a._obj)
+        elif isinstance(a, (bytes, bytearray)):
+            params += bytes(a)
+        elif isinstance(a, (int, bool)):
+            params += bytes([int(a) & 0xFF])
+        else:
+            params += bytes(a)
+
+    return params
+
+# Copy the response parameters into the output arguments of a Get call.
+# String buffers come with their length (GetAlarmsState) or size
+# (GetDeviceSN) after them.
+def decode(response, args):
+    i = 0
+    offset = 0
+    while i < len(args):
+        a = args[i]
+        if isinstance(a, CArgObject):
+            size = sizeof(a._obj)
+            memmove(addressof(a._obj), response[offset:offset + size], min(size, len(response) - offset))
+            offset += size
+        elif isinstance(a, Array):
+            data = response[offset:offset + len(a)]
+            memmove(a, data, len(data))
+            if i + 1 < len(args) and isinstance(args[i + 1], CArgObject):
+                args[i + 1]._obj.value = len(data)
+                i += 1
+            offset += len(data)
+        i += 1
+
+def load():
+    return SerialDll()
@@ -0,0 +1,196 @@
+from ctypes import *
+import collections
+import bisect
+import gzip
+import json
+import threading
+import time
+
+from dobot.StubDll import CArgObject
+
+trace_version = 1
+
+# Contents of every buffer argument of a call, None for plain values.
+# Trailing zero bytes are left out, buffers are passed in zeroed.
+def buffers(args):
+    result = []
+    for a in args:
+        if isinstance(a, CArgObject):
+            result.append(bytes(a._obj).rstrip(b"\0").hex())
+        elif isinstance(a, Array):
+            result.append(bytes(a).rstrip(b"\0").hex())
+        else:
+            result.append(None)
+
+    return result
+
+# Every plain argument of a call as a JSON value, None for buffers
+def values(args):
+    result = []
+    for a in args:
+        if isinstance(a, (CArgObject, Array)):
+            result.append(None)
+        elif isinstance(a, (c_int, c_uint, c_uint64, c_float, c_byte, c_ubyte)):
+            result.append(a.value)
+        elif isinstance(a, (bool, int, float, str)) or a is None:
+            result.append(a)
+        else:
+            result.append(repr(a))
+
+    return result
+
+# Proxy for the loaded DLL that logs every raw call with its plain
+# arguments, result code, latency and the buffers it passed to a gzipped
+# JSON lines trace. mark() and end() note where each job phase starts and
+# ends. All times are seconds since the recording started.
+class RecordingDll:
+    def __init__(self, api, filename):
+        self.api = api
+        self.lock = threading.Lock()
+        self.file = gzip.open(filename, "wt")
+        self.started = time.perf_counter()
+        self.write({"version": trace_version})
+
+    def __getattr__(self, name):
+        func = getattr(self.api, name)
+
+        def call(*args):
+            start = time.perf_counter()
+            result = func(*args)
+            elapsed = time.perf_counter() - start
+
+            self.write({"n": name, "s": round(start - self.started, 6), "r": result, "t": round(elapsed, 6), "a": values(args), "o": buffers(args)})
+            return result
+
+        # Cache so later calls skip __getattr__
+        setattr(self, name, call)
+        return call
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":"))
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(line + "\n")
+
+    def now(self):
+        return round(time.perf_counter() - self.started, 6)
+
+    def mark(self, phase):
+        self.write({"m": phase, "s": self.now()})
+
+    def end(self, phase):
+        self.write({"e": phase, "s": self.now()})
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def DisconnectDobot(self, *args):
+        result = self.__getattr__("DisconnectDobot")(*args)
+        self.close()
+        return result
+
+def readTrace(filename):
+    with gzip.open(filename, "rt") as f:
+        records = [json.loads(line) for line in f]
+
+    if not records or records[0].get("version") != trace_version:
+        raise ValueError(filename + " is not a Dobot call trace")
+
+    return records[1:]
+
+# Stand-in for the loaded DLL that answers calls from a recorded trace,
+# sleeping for the recorded latency (divided by speed) and filling in the
+# recorded buffers. Each Set call name replays its own recorded calls in
+# order, repeating the last one once they run out. A Get call is answered
+# by the last one recorded at the same time into the replay, so polling
+# loops see the arm progress as it did however often they poll. Names
+# that were never recorded succeed straight away.
+class ReplayDll:
+    def __init__(self, filename, speed=1):
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.missing = 0
+        self.records = readTrace(filename)
+        self.seek(None)
+
+    # Start replaying from where phase began in the recording, or from
+    # the beginning
+    def seek(self, phase):
+        start = 0
+        if phase is not None:
+            marks = [i for i in range(len(self.records)) if self.records[i].get("m") == phase]
+            if not marks:
+                raise ValueError("no " + phase + " phase in the trace")
+            start = marks[0] + 1
+
+        streams = collections.defaultdict(list)
+        for r in self.records[start:]:
+            if "n" in r:
+                streams[r["n"]].append(r)
+
+        self.streams = dict(streams)
+        self.times = {name: [r["s"] for r in stream] for name, stream in self.streams.items()}
+        self.positions = dict.fromkeys(self.streams, 0)
+
+        recorded = [r["s"] for r in self.records[start:] if "n" in r]
+        self.recordedStart = recorded[0] if recorded else 0
+        self.replayStart = None
+
+    # Seconds the phase took when it was recorded
+    def phaseTime(self, phase):
+        start = None
+        for r in self.records:
+            if r.get("m") == phase and start is None:
+                start = r["s"]
+            elif r.get("e") == phase and start is not None:
+                return r["s"] - start
+
+        return None
+
+    def __getattr__(self, name):
+        def call(*args):
+            return self.replay(name, args)
+
+        return call
+
+    def replay(self, name, args):
+        with self.lock:
+            self.calls += 1
+            stream = self.streams.get(name)
+            if not stream:
+                self.missing += 1
+                return 0
+
+            if self.replayStart is None:
+                self.replayStart = time.perf_counter()
+
+            if name.startswith("Get"):
+                now = self.recordedStart + (time.perf_counter() - self.replayStart) * self.speed
+                position = max(bisect.bisect_right(self.times[name], now) - 1, 0)
+            else:
+                position = min(self.positions[name], len(stream) - 1)
+                self.positions[name] += 1
+
+            record = stream[position]
+
+        if record["t"] > 0:
+            time.sleep(record["t"] / self.speed)
+
+        for a, data in zip(args, record["o"]):
+            if data is None:
+                continue
+            data = bytes.fromhex(data)
+            if isinstance(a, CArgObject):
+                memmove(addressof(a._obj), data, min(len(data), sizeof(a._obj)))
+            elif isinstance(a, Array):
+                memmove(a, data, min(len(data), sizeof(a)))
+
+        return record["r"]
+
+    def mark(self, phase):
+        pass
+
+    def end(self, phase):
+        pass
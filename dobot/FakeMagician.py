@@ -0,0 +1,270 @@
+from ctypes import *
+import argparse
+import os
+import random
+import threading
+import time
+
+from dobot import DobotDllType as dType
+from dobot.DobotSerial import PacketReader, packet
+
+# Seconds a HOME takes on the real arm
+home_time = 15
+
+# A Dobot Magician on the other end of a pseudo terminal, for running the
+# serial backend without hardware. Queued commands go into a queue of
+# queue_size and are executed in order while the queue is started, taking
+# as long as the arm would (divided by speed). Faults can be injected:
+# every response is held back `delay` seconds, a `drop` fraction of the
+# packets received is lost and a `buffer_full` fraction of free space
+# queries answer that the queue is full, so the sender has to wait and ask
+# again. A queued command that overflows the queue gets no acknowledgement.
+# While a move or HOME
+# runs, GetPose reports the arm part way along a straight line to where it
+# ends up.
+class FakeMagician:
+    def __init__(self, queue_size=32, speed=1, delay=0, drop=0, buffer_full=0, seed=None):
+        self.queue_size = queue_size
+        self.speed = speed
+        self.delay = delay
+        self.drop = drop
+        self.buffer_full = buffer_full
+        self.random = random.Random(seed)
+
+        self.queue = []
+        self.queuedIndex = 0
+        self.currentIndex = 0
+        self.running = False
+        self.pose = [200, 0, 0, 0, 0, 0, 0, 0]
+        self.motion = None
+        self.alarms = bytearray(16)
+
+        self.coordinate = dType.PTPCoordinateParams(200, 200, 200, 200)
+        self.joint = dType.PTPJointParams(*([200] * 8))
+        self.jump = dType.PTPJumpParams(20, 100)
+        self.common = dType.PTPCommonParams(100, 100)
+        self.home = dType.HOMEParams(200, 0, 0, 0)
+
+        self.received = 0
+        self.dropped = 0
+        self.refused = 0
+
+        self.lock = threading.Condition()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.master = None
+
+    # Open the pseudo terminal and return the port name to connect to
+    def start(self):
+        import pty
+        import tty
+
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.slave = slave
+
+        for target in (self.serve, self.execute):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+        return os.ttyname(slave)
+
+    def stop(self):
+        self.stopping.set()
+        with self.lock:
+            self.lock.notify_all()
+        os.close(self.slave)
+        os.close(self.master)
+
+    def serve(self):
+        reader = PacketReader()
+        while not self.stopping.is_set():
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+
+            for id, ctrl, params in reader.feed(data):
+                self.received += 1
+                if self.random.random() < self.drop:
+                    self.dropped += 1
+                    continue
+
+                response = self.handle(id, ctrl, params)
+                if response is None:
+                    continue
+
+                if self.delay:
+                    time.sleep(self.delay)
+                os.write(self.master, packet(id, ctrl & 1, ctrl & 2, response))
+
+    # Response parameters for a packet, or None to send nothing back
+    def handle(self, id, ctrl, params):
+        write = ctrl & 1
+        queued = ctrl & 2
+
+        with self.lock:
+            if queued:
+                if len(self.queue) >= self.queue_size:
+                    return None
+
+                self.queuedIndex += 1
+                self.queue.append((self.queuedIndex, id, bytes(params)))
+                self.lock.notify_all()
+                return self.queuedIndex.to_bytes(8, "little")
+
+            if id == 0:
+                return b"FAKE0001"
+            if id == 10:
+                return bytes((c_float * 8)(*self.currentPose()))
+            if id == 20:
+                if write:
+                    self.alarms = bytearray(16)
+                    return b""
+                return bytes(self.alarms)
+            if id == 240:
+                self.running = True
+                self.lock.notify_all()
+            elif id == 241:
+                self.running = False
+            elif id == 242:
+                self.running = False
+                self.queue = []
+                self.lock.notify_all()
+            elif id == 245:
+                self.queue = []
+            elif id == 246:
+                return self.currentIndex.to_bytes(8, "little")
+            elif id == 247:
+                if self.random.random() < self.buffer_full:
+                    self.refused += 1
+                    return (0).to_bytes(4, "little")
+                return (self.queue_size - len(self.queue)).to_bytes(4, "little")
+            elif write:
+                self.apply(id, params)
+
+            return b""
+
+    def apply(self, id, params):
+        if id == 30:
+            self.home = dType.HOMEParams.from_buffer_copy(params)
+        elif id == 80:
+            self.joint = dType.PTPJointParams.from_buffer_copy(params)
+        elif id == 81:
+            self.coordinate = dType.PTPCoordinateParams.from_buffer_copy(params)
+        elif id == 82:
+            self.jump = dType.PTPJumpParams.from_buffer_copy(params)
+        elif id == 83:
+            self.common = dType.PTPCommonParams.from_buffer_copy(params)
+
+    # How long a queued command takes on the arm, in seconds
+    def duration(self, id, params):
+        import simulator
+
+        if id == 31:
+            return home_time
+        if id == 110:
+            return dType.WAITCmd.from_buffer_copy(params).waitTime / 1000
+        if id != 84:
+            return 0
+
+        cmd = dType.PTPCmd.from_buffer_copy(params)
+        start = tuple(self.pose[:3])
+        target = (cmd.x, cmd.y, cmd.z)
+        velocity = self.coordinate.xyzVelocity * self.common.velocityRatio / 100
+        acceleration = self.coordinate.xyzAcceleration * self.common.accelerationRatio / 100
+
+        if cmd.ptpMode == dType.PTPMode.PTPMOVJXYZMode:
+            seconds = simulator.jointMoveTime(start, target,
+                self.joint.joint1Velocity * self.common.velocityRatio / 100,
+                self.joint.joint1Acceleration * self.common.accelerationRatio / 100)
+        elif cmd.ptpMode == dType.PTPMode.PTPJUMPXYZMode:
+            top = min(max(start[2], target[2]) + self.jump.jumpHeight, self.jump.zLimit)
+            seconds = (simulator.moveTime(max(top - start[2], 0), velocity, acceleration)
+                + simulator.moveTime(simulator.distance((start[0], start[1], top), (target[0], target[1], top)), velocity, acceleration)
+                + simulator.moveTime(max(top - target[2], 0), velocity, acceleration))
+        else:
+            seconds = simulator.moveTime(simulator.distance(start, target), velocity, acceleration)
+
+        return seconds
+
+    # Where a queued command leaves the arm, None if it doesn't move it
+    def target(self, id, params):
+        if id == 31:
+            return [self.home.x, self.home.y, self.home.z]
+        if id == 84:
+            cmd = dType.PTPCmd.from_buffer_copy(params)
+            return [cmd.x, cmd.y, cmd.z]
+        return None
+
+    # Call with lock held
+    def currentPose(self):
+        if self.motion is None:
+            return self.pose
+
+        start, end, started, seconds = self.motion
+        done = min((time.perf_counter() - started) / seconds, 1) if seconds > 0 else 1
+        return [a + (b - a) * done for a, b in zip(start, end)] + self.pose[3:]
+
+    # Call with lock held
+    def finish(self, id, params):
+        import kinematics
+
+        # Queued parameter commands take effect when they run
+        self.apply(id, params)
+
+        target = self.target(id, params)
+        if target is None:
+            return
+
+        joints = kinematics.inverse(*target)
+        self.pose[0:3] = target
+        if joints is not None:
+            self.pose[4:7] = joints
+
+    def execute(self):
+        while not self.stopping.is_set():
+            with self.lock:
+                while not (self.running and self.queue) and not self.stopping.is_set():
+                    self.lock.wait()
+                if self.stopping.is_set():
+                    return
+
+                index, id, params = self.queue[0]
+                seconds = self.duration(id, params) / self.speed
+
+                target = self.target(id, params)
+                if target is not None:
+                    self.motion = (self.pose[0:3], target, time.perf_counter(), seconds)
+
+            # A force stop empties the queue and cuts the command short
+            with self.lock:
+                self.lock.wait_for(lambda: not self.queue or self.queue[0][0] != index or self.stopping.is_set(), seconds)
+                if self.queue and self.queue[0][0] == index:
+                    self.queue.pop(0)
+                    self.finish(id, params)
+                    self.currentIndex = index
+                elif self.motion is not None:
+                    self.pose[0:3] = self.currentPose()[0:3]
+                self.motion = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Dobot Magician on a pseudo terminal")
+    parser.add_argument("--queue-size", type=int, default=32, help="commands the queue holds")
+    parser.add_argument("--speed", type=float, default=1, help="run commands this many times faster than the arm")
+    parser.add_argument("--delay", type=float, default=0, help="seconds to hold back every response")
+    parser.add_argument("--drop", type=float, default=0, help="fraction of received packets to lose")
+    parser.add_argument("--buffer-full", type=float, default=0, help="fraction of free space queries to answer as if the queue were full")
+    parser.add_argument("--seed", type=int, help="random seed for the injected faults")
+    args = parser.parse_args()
+
+    device = FakeMagician(args.queue_size, args.speed, args.delay, args.drop, args.buffer_full, args.seed)
+    print("Fake Magician on", device.start())
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Received %d packets, dropped %d, reported full %d times" % (device.received, device.dropped, device.refused))
+        device.stop()
@@ -0,0 +1,73 @@
+from ctypes import *
+import time
+
+from dobot import DobotDllType as dType
+
+# Type of the object returned by byref(), used to find output parameters
+CArgObject = type(byref(c_int()))
+
+# Stand-in for the CDLL object returned by dType.load(). It answers every
+# API call successfully, hands out queue indices like the real controller
+# and executes queued commands instantly, so host side code can be run and
+# timed without an arm attached.
+class StubDll:
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.calls = 0
+        self.queuedIndex = 0
+        self.executedIndex = 0
+        self.running = False
+        self.pose = [200, 0, 0, 0, 0, 0, 0, 0]
+
+    def __getattr__(self, name):
+        def call(*args):
+            return self.generic(name, args)
+
+        return call
+
+    def tick(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def generic(self, name, args):
+        self.tick()
+
+        # Queued commands end in (..., isQueued, byref(queuedCmdIndex))
+        if len(args) >= 2 and isinstance(args[-1], CArgObject) and type(args[-1]._obj) == c_uint64:
+            if args[-2]:
+                self.queuedIndex += 1
+                args[-1]._obj.value = self.queuedIndex
+
+        return dType.DobotCommunicate.DobotCommunicate_NoError
+
+    def ConnectDobot(self, portName, baudrate, connectInfo):
+        self.tick()
+        connectInfo._obj.masterDevInfo.type = dType.DevType.Magician
+        return dType.DobotConnect.DobotConnect_NoError
+
+    def SetPTPCmd(self, masterId, slaveId, cmd, isQueued, queuedCmdIndex):
+        self.pose[0:3] = [cmd._obj.x, cmd._obj.y, cmd._obj.z]
+        return self.generic("SetPTPCmd", (masterId, slaveId, cmd, isQueued, queuedCmdIndex))
+
+    def GetPose(self, masterId, slaveId, pose):
+        self.tick()
+        pose._obj.x, pose._obj.y, pose._obj.z, pose._obj.rHead = self.pose[0:4]
+        return dType.DobotCommunicate.DobotCommunicate_NoError
+
+    def SetQueuedCmdStartExec(self, masterId, slaveId):
+        self.tick()
+        self.running = True
+        return dType.DobotCommunicate.DobotCommunicate_NoError
+
+    def SetQueuedCmdStopExec(self, masterId, slaveId):
+        self.tick()
+        self.running = False
+        return dType.DobotCommunicate.DobotCommunicate_NoError
+
+    def GetQueuedCmdCurrentIndex(self, masterId, slaveId, queuedCmdIndex):
+        self.tick()
+        if self.running:
+            self.executedIndex = self.queuedIndex
+        queuedCmdIndex._obj.value = self.executedIndex
+        return dType.DobotCommunicate.DobotCommunicate_NoError
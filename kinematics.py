@@ -0,0 +1,88 @@
+import math
+
+# Dobot Magician arm geometry (mm). The rear arm hangs off the shoulder,
+# the forearm is kept at an absolute angle by the parallelogram linkage
+# and the end effector sits tool_r in front of and tool_z below the wrist.
+# The pump never sets end effector params, so the arm reports coordinates
+# at the wrist.
+rear_arm = 135
+fore_arm = 147
+tool_r = 0
+tool_z = 0
+
+# Joint limits in degrees: base, rear arm (from vertical) and forearm
+# (from horizontal)
+joint_limits = [(-90, 90), (0, 85), (-10, 95)]
+
+# Joint angles (degrees) that put the end effector at x, y, z, or None if
+# the point is out of reach
+def inverse(x, y, z):
+    r = math.sqrt(x*x + y*y) - tool_r
+    h = z - tool_z
+    d = math.sqrt(r*r + h*h)
+
+    if d > rear_arm + fore_arm or d < abs(rear_arm - fore_arm) or d == 0:
+        return None
+
+    # Elbow up: rear arm elevation is the target elevation plus the angle
+    # between the rear arm and the shoulder to wrist line
+    elevation = math.atan2(h, r) + math.acos((rear_arm*rear_arm + d*d - fore_arm*fore_arm) / (2 * rear_arm * d))
+    elbowR = rear_arm * math.cos(elevation)
+    elbowH = rear_arm * math.sin(elevation)
+
+    j1 = math.degrees(math.atan2(y, x))
+    j2 = 90 - math.degrees(elevation)
+    j3 = -math.degrees(math.atan2(h - elbowH, r - elbowR))
+
+    return (j1, j2, j3)
+
+def forward(j1, j2, j3):
+    r = rear_arm * math.sin(math.radians(j2)) + fore_arm * math.cos(math.radians(j3)) + tool_r
+    h = rear_arm * math.cos(math.radians(j2)) - fore_arm * math.sin(math.radians(j3))
+
+    return (r * math.cos(math.radians(j1)), r * math.sin(math.radians(j1)), h + tool_z)
+
+def withinLimits(joints):
+    for angle, (low, high) in zip(joints, joint_limits):
+        if angle < low or angle > high:
+            return False
+
+    return True
+
+# inverse() for an (N, 3) array of points at once. Rows that are out of
+# reach come back as NaN.
+def inverseArray(points):
+    import numpy as np
+
+    p = np.asarray(points, dtype=float).reshape(-1, 3)
+    r = np.hypot(p[:, 0], p[:, 1]) - tool_r
+    h = p[:, 2] - tool_z
+    d = np.hypot(r, h)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cosine = (rear_arm*rear_arm + d*d - fore_arm*fore_arm) / (2 * rear_arm * d)
+        elevation = np.arctan2(h, r) + np.arccos(cosine)
+
+    elbowR = rear_arm * np.cos(elevation)
+    elbowH = rear_arm * np.sin(elevation)
+
+    joints = np.degrees(np.stack((
+        np.arctan2(p[:, 1], p[:, 0]),
+        np.pi / 2 - elevation,
+        -np.arctan2(h - elbowH, r - elbowR),
+    ), axis=1))
+
+    outOfReach = (d > rear_arm + fore_arm) | (d < abs(rear_arm - fore_arm)) | (d == 0)
+    joints[outOfReach] = np.nan
+    return joints
+
+# Degrees each row of joint angles is inside its closest limit, negative
+# when a limit is exceeded and -inf when the point is out of reach
+def limitMargin(joints):
+    import numpy as np
+
+    low = np.array([l[0] for l in joint_limits])
+    high = np.array([l[1] for l in joint_limits])
+    margin = np.min(np.minimum(joints - low, high - joints), axis=1)
+
+    return np.where(np.isnan(margin), -np.inf, margin)
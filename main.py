@@ -1,23 +1,71 @@
-from pygcode import Line, GCodeDwell
-from pygcode.gcodes import GCodeRapidMove
 from dobot import DobotDllType as dType
-from tqdm import tqdm
+from dobot import DobotLock
+import argparse
+import bisect
+import contextlib
 import time
-import turtle
 import sys
 
+from commands import *
+import compiler
+import armstate
+import checkpoint
+import metrics
+import starvation
+import watchdog
+
 CON_STR = {
     dType.DobotConnect.DobotConnect_NoError:  "DobotConnect_NoError",
     dType.DobotConnect.DobotConnect_NotFound: "DobotConnect_NotFound",
     dType.DobotConnect.DobotConnect_Occupied: "DobotConnect_Occupied"
 }
 
-api = dType.load()
-state = dType.ConnectDobot(api, "COM4", 115200)[0]
-print("Connect status:", CON_STR[state])
+dobot_port = "COM4"
+
+api = None
+state = None
+
+# DobotTrace.RecordingDll when recording the session's API calls
+trace = None
+
+# timeline.Timeline of the session's spans when --timeline is given
+jobTimeline = None
+
+# Alarm watchdog for the running job, checked while queueing and waiting
+jobWatchdog = None
+
+# Load the DLL or the backend standing in for it, wrapped in the proxies
+# the options ask for. Done before the first phase so a recorded trace
+# marks the start of every phase.
+def loadApi():
+    global api, trace
+
+    if options is not None and options.replay:
+        from dobot import DobotTrace
+        api = DobotTrace.ReplayDll(options.replay)
+    elif options is not None and options.backend == "serial":
+        from dobot import DobotSerial
+        api = DobotSerial.load()
+    else:
+        api = dType.load()
 
-gcode_offset = [-43, 0, 0]
-griddle_home = [150, -25, 35]
+    # Metrics count raw calls through the instrumentation's call hook
+    if options is not None and (options.instrument or options.metrics_port or options.metrics_file):
+        from dobot import DobotInstrument
+        api = DobotInstrument.wrapApi(api)
+
+    if options is not None and options.record:
+        from dobot import DobotTrace
+        api = trace = DobotTrace.RecordingDll(api, options.record)
+
+    # The alarm watchdog and pose recorder call in from their own threads
+    api = DobotLock.LockedDll(api)
+
+def connect(port=dobot_port, baudrate=115200):
+    global state
+
+    state = dType.ConnectDobot(api, port, baudrate)[0]
+    print("Connect status:", CON_STR[state])
 
 class PancakePlot:
     def __init__(self, commands, x_offset=0, y_offset=0):
@@ -28,6 +76,8 @@ class PancakePlot:
         self.plot()
 
     def plot(self):
+        import turtle
+
         turtle.tracer(0, 0)
         turtle.color("blue")
         turtle.width(3)
@@ -41,7 +91,7 @@ class PancakePlot:
                 turtle.pendown()   
                 continue
             
-            if type(c) == Move:
+            if type(c) == Move or type(c) == Jump:
                 turtle.goto(c.x+self.x_offset, -c.y+self.y_offset)
         
         turtle.color("red")
@@ -53,7 +103,7 @@ class PancakePlot:
                 turtle.pendown()   
                 continue
             
-            if type(c) == Move:
+            if type(c) == Move or type(c) == Jump:
                 turtle.goto(c.x+self.x_offset, -c.y+self.y_offset)
 
         turtle.update()
@@ -66,112 +116,20 @@ class PancakePlot:
         self.currentIndex = index
         self.plot()
 
-class Home:
-    def execute(self):
-        return dType.SetHOMECmd(api, 0, isQueued=1)[0]
-
-    def __repr__(self):
-        return "<HOME>"
-
-class PumpOn:
-    def execute(self):
-        return dType.SetEndEffectorGripper(api, True, False, isQueued=1)[0]
-
-    def __repr__(self):
-        return "<PUMP_ON>"
-
-class PumpOff:
-    def execute(self):
-        return dType.SetEndEffectorGripper(api, True, True, isQueued=1)[0]
-    
-    def __repr__(self):
-        return "<PUMP_OFF>"
-
-class PumpDisable:
-    def execute(self):
-        return dType.SetEndEffectorGripper(api, True, True, isQueued=1)[0]
-
-    def __repr__(self):
-        return "<PUMP_DISABLE>"
-
-class Move:
-    def __init__(self, x, y, z=griddle_home[2]):
-        self.x = griddle_home[0] + x
-        self.y = griddle_home[1] + y
-        self.z = z
-
-    def execute(self):
-        return dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, self.x, self.y, self.z, 0, isQueued=1)[0]
-        
-    def __repr__(self):
-        return "<MOVE x=" + str(self.x) + " y=" + str(self.y) + ">"
-
-class UR3:
-    def execute(self):
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 114.4, -91, 42.7, 0, isQueued=1)[0]
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 114.4, -91, -30.7, 0, isQueued=1)[0]
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 138.2, -91, -29.3, 0, isQueued=1)[0]
-        dType.SetWAITCmd(api, 1000, isQueued=1)[0]
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 114.4, -91, -30.7, 0, isQueued=1)[0]
-
-        return dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 114.4, -91, 42.7, 0, isQueued=1)[0]
-    
-class PAM:
-    def execute(self):
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 114.4, -91, 42.7, 0, isQueued=1)[0]
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 108.8, -146.5, -26.8, 0, isQueued=1)[0]
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 150, -150, -27, 0, isQueued=1)[0]
-        dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 108.8, -146.5, -26.8, 0, isQueued=1)[0]
-
-        return dType.SetPTPCmd(api, dType.PTPMode.PTPMOVLXYZMode, 114.4, -91, 42.7, 0, isQueued=1)[0]
-
-class Feedrate:
-    def __init__(self, feed):
-        self.feed = feed*60
-
-    def execute(self):
-        return dType.SetPTPJointParams(api, 200, 400, 200, 400, 200, 400, 200, 400, 1)[0]
-
-    def __repr__(self):
-        return "<FEEDRATE feed=" + str(self.feed) + ">"
-
-class Wait:
-    def __init__(self, ms):
-        self.ms = ms
-
-    def execute(self):
-        return dType.SetWAITCmd(api, self.ms, isQueued=1)[0]
-
-    def __repr__(self):
-        return "<WAIT ms=" + str(self.ms) + ">"
-
-    def __add__(self, other):
-        return Wait(self.ms + other.ms)
-
-    def __radd__(self, other):
-        if other == 0:
-            return self
-        else:
-            return self.__add__(other)
-
-class SetIO:
-    def __init__(self, port, level):
-        self.port = port
-        self.level = level
-
-    def execute(self):
-        return dType.SetIODOEx(api, self.port, self.level, isQueued=1)[0]
-
-    def __repr__(self):
-        return "<SETIO port=" + str(self.port) + " level=" + + str(self.level) + ">"
-
 def load_gcode_commands(filename):
+    from pygcode import Line, GCodeDwell
+    from pygcode.gcodes import GCodeRapidMove, GCodeFeedRate
+    from tqdm import tqdm
+
     gfile = open(filename)
 
     lines = gfile.read().split("\n")
 
     print("Processing GCODE...")
-    commandList = []
+
+    # Start from a known speed, the arm keeps whatever the last job left
+    feed = default_velocity * 60
+    commandList = [SpeedRatio(), Feedrate(feed)]
 
     for line in tqdm(lines):
         # Comment
@@ -192,6 +150,13 @@ def load_gcode_commands(filename):
             continue
 
         gcodeLine = Line(line).block.gcodes
+
+        # Only queue a speed change when the speed actually changes
+        for g in gcodeLine:
+            if type(g) == GCodeFeedRate and g.word.value != feed:
+                feed = g.word.value
+                commandList.append(Feedrate(feed))
+
         if len(gcodeLine) > 0:
             if type(gcodeLine[0]) == GCodeDwell:
                 # Set Robot Delay
@@ -207,6 +172,10 @@ def load_gcode_commands(filename):
                 except KeyError:
                     pass
                 
+    # Leave the default speed behind for the flip and park moves
+    if feed != default_velocity * 60:
+        commandList.append(Feedrate(default_velocity * 60))
+
     # Return last index of queue
     commandList.append(PumpDisable())
 
@@ -219,114 +188,583 @@ def chunks(l, n):
     for i in range(0, len(l), n):
         yield l[i:i+n]
 
-def executeQueue(queue, plot=False):
+# Time the with block as a span on the timeline, if there is one
+def span(name, category="job", **args):
+    if jobTimeline is None:
+        return contextlib.nullcontext()
+    return jobTimeline.span(name, category, **args)
+
+# Waiting for a chunk polls the queue index every poll_interval seconds.
+# With predicted_wait the chunk's run time is estimated with the motion
+# model in simulator.py instead: the index is polled every
+# predicted_poll_interval seconds (to keep progress and the preview
+# moving) until fine_poll_lead seconds plus prediction_slack of the
+# estimate before the predicted end, then every fine_poll_interval
+# seconds. Past the predicted end the interval doubles back up to
+# poll_interval. Estimates are scaled by how long chunks actually took
+# against their estimates so far, smoothed by prediction_smoothing.
+poll_interval = 0.2
+predicted_wait = True
+predicted_poll_interval = 1
+fine_poll_interval = 0.02
+fine_poll_lead = 0.05
+prediction_slack = 0.05
+prediction_smoothing = 0.3
+
+predictionScale = 1
+
+def pollInterval(now, deadline, window, late):
+    if not predicted_wait:
+        return poll_interval
+    if now < deadline - window:
+        return min(deadline - window - now, predicted_poll_interval)
+    if now < deadline:
+        return fine_poll_interval
+    return min(fine_poll_interval * 2 ** late, poll_interval)
+
+# Learn from a chunk that ran for actual seconds against an estimate of
+# expected seconds
+def learnPrediction(expected, actual):
+    global predictionScale
+
+    predictionScale += prediction_smoothing * (actual / expected - predictionScale)
+    metrics.prediction_scale.value = predictionScale
+
+def checkAlarms():
+    if jobWatchdog is not None:
+        jobWatchdog.check()
+
+# plot can be True to open a preview or an already open PancakePlot.
+# The queue index each command ends on is appended to queueIndices.
+# progress is called with the number of commands the arm has confirmed
+# executing as that grows. starvation, a starvation.StarvationDetector,
+# is told whenever the arm's queue runs empty and is refilled. Raises
+# AlarmError, after stopping the queue again, if the watchdog stopped the
+# arm.
+def executeQueue(queue, plot=False, queueIndices=None, progress=None, starvation=None):
 
     if plot:
-        commandPlot = PancakePlot(queue)
+        commandPlot = plot if isinstance(plot, PancakePlot) else PancakePlot(queue)
 
     chunk_size = 25
     chunk_set = chunks(queue, chunk_size)
+    executed = 0
 
-    for c in chunk_set:
-        toIndex = -1
-
-        for op in c:
-            toIndex = op.execute()
-
-        dType.SetQueuedCmdStartExec(api)
-
-        if plot:
-            initial = dType.GetQueuedCmdCurrentIndex(api)[0]
-            orig = commandPlot.currentIndex
-            commandPlot.next()
+    if predicted_wait:
+        import simulator
+        times = simulator.commandTimes(queue, tuple(dType.GetPose(api)[:3]))
 
+    try:
+        for chunk, c in enumerate(chunk_set):
+            checkAlarms()
+            toIndex = -1
+            chunkIndices = []
+
+            with span("submit", "chunk", chunk=chunk, commands=len(c)):
+                for op in c:
+                    toIndex = op.execute(api)
+                    chunkIndices.append(toIndex)
+                    metrics.commands_queued.value += 1
+                    if queueIndices is not None:
+                        queueIndices.append(toIndex)
+
+                # The watchdog can't stop the arm between the check and the start
+                with DobotLock.lock:
+                    checkAlarms()
+                    dType.SetQueuedCmdStartExec(api)
+                started = time.perf_counter()
+                if starvation is not None:
+                    starvation.refilled()
+
+            if predicted_wait:
+                expected = sum(times[executed:executed + len(c)])
+                deadline = started + expected * predictionScale
+                window = fine_poll_lead + prediction_slack * expected
+            else:
+                deadline = window = 0
+            late = 0
+            lastBusy = None
 
-        while toIndex > dType.GetQueuedCmdCurrentIndex(api)[0]:
             if plot:
-                commandPlot.setIndex(orig+(dType.GetQueuedCmdCurrentIndex(api)[0]-initial))
-                    
-            time.sleep(0.2)
-        if plot:
-            commandPlot.next()
-        dType.SetQueuedCmdStopExec(api)
-        dType.SetQueuedCmdClear(api)
+                initial = dType.GetQueuedCmdCurrentIndex(api)[0]
+                orig = commandPlot.currentIndex
+                commandPlot.next()
+
+
+            with span("wait", "chunk", chunk=chunk):
+                current = dType.GetQueuedCmdCurrentIndex(api)[0]
+                polled = time.perf_counter()
+                metrics.queue_polls.value += 1
+                while toIndex > current:
+                    lastBusy = polled
+                    if starvation is not None:
+                        starvation.update(toIndex, current, len(queue) - executed - len(c))
+                    metrics.queue_index.value = current
+                    metrics.queue_depth.value = toIndex - current
+                    checkAlarms()
+                    if plot:
+                        commandPlot.setIndex(orig+(current-initial))
+                    if progress is not None:
+                        progress(executed + bisect.bisect_right(chunkIndices, current))
+
+                    now = time.perf_counter()
+                    interval = pollInterval(now, deadline, window, late)
+                    if now >= deadline:
+                        late += 1
+
+                    time.sleep(interval)
+                    current = dType.GetQueuedCmdCurrentIndex(api)[0]
+                    polled = time.perf_counter()
+                    metrics.queue_polls.value += 1
+
+                # Upper bound on how long the chunk had finished before it was noticed
+                if lastBusy is not None:
+                    metrics.completion_latency.value += polled - lastBusy
+                    metrics.completions.value += 1
+
+                    # Short chunks are timed too coarsely to learn from
+                    if predicted_wait and expected > predicted_poll_interval:
+                        learnPrediction(expected, (lastBusy + polled) / 2 - started)
+
+            if starvation is not None:
+                starvation.update(toIndex, current, len(queue) - executed - len(c))
+
+            executed += len(c)
+            metrics.chunks.value += 1
+            metrics.queue_index.value = current
+            metrics.queue_depth.value = 0
+            if progress is not None:
+                progress(executed)
+            if plot:
+                commandPlot.next()
+            dType.SetQueuedCmdStopExec(api)
+            dType.SetQueuedCmdClear(api)
+    except watchdog.AlarmError:
+        # Stop the queue again in case the chunk was queued while the
+        # watchdog stopped the arm
+        watchdog.abort(api)
+        raise
 
     dType.SetQueuedCmdClear(api)
 
-# This should not be this hard -_-
-def homeRobot():
-    dType.SetHOMECmd(api, 0)
+# Home through the command queue and wait for the controller to report
+# the HOME command as executed
+def homeRobot(timeout=60):
+    start = time.time()
 
-    counterThresh = 15
-    tCounter = 0
-    lastPose = dType.GetPose(api)
+    # The HOME parameters are queued after the clear so they still apply
+    dType.SetQueuedCmdClear(api)
+    dType.SetHOMEParams(api, 200, 200, 200, 200, 1)
+    homeIndex = Home().execute(api)
     dType.SetQueuedCmdStartExec(api)
 
-    while tCounter < counterThresh:
-        if lastPose == dType.GetPose(api):
-            tCounter += 1
-        else:
-            tCounter = 0
-
-        lastPose = dType.GetPose(api)
-        time.sleep(0.1)
+    homed = True
+    while dType.GetQueuedCmdCurrentIndex(api)[0] < homeIndex:
+        if time.time() - start > timeout:
+            homed = False
+            break
+        time.sleep(0.05)
 
     dType.SetQueuedCmdStopExec(api)
     dType.SetQueuedCmdClear(api)
-    print("Done Homing")
 
-def main():
+    if homed:
+        print("Done Homing in %.1f seconds" % (time.time() - start))
+    else:
+        print("Homing did not finish within", timeout, "seconds")
 
-    dType.ClearAllAlarmsState(api)
+    return homed
 
-    if state == dType.DobotConnect.DobotConnect_Occupied:
-        return 
+# Wall clock time of each startup and job phase
+phaseTimes = {}
 
-    ####### STARTUP #######
-    dType.SetQueuedCmdClear(api)
-    dType.ClearAllAlarmsState(api)
-    executeQueue([PumpOff()])
+def timePhase(name, func, *args):
+    if trace is not None:
+        trace.mark(name)
 
-    dType.SetHOMEParams(api, 200, 200, 200, 200, 1)
+    start = time.time()
+    try:
+        with span(name, "phase"):
+            return func(*args)
+    finally:
+        phaseTimes[name] = time.time() - start
+        print("[%s] %.2f seconds" % (name, phaseTimes[name]))
+        metrics.phase_seconds.child(name).value = phaseTimes[name]
+
+        if trace is not None:
+            trace.end(name)
+
+# Host side job preparation, runs while the arm gets ready
+def prepareJob(filename, job):
+    try:
+        commands = timePhase("parse", load_gcode_commands, filename)
+        stats = {}
+        commands = timePhase("compile", compiler.compile, commands, stats)
+        compiler.printPeephole(stats)
+
+        problems, closest = timePhase("validate", compiler.checkReach, commands)
+        compiler.printReach(commands, problems, closest)
+
+        job["commands"] = commands
+        job["valid"] = len(problems) == 0
+    except Exception as e:
+        job["error"] = e
 
-    if "-h" in sys.argv:
-        homeRobot()
+# Connect and get the arm ready to print. Returns the saved arm state key
+# and state, or None if the arm can't be used.
+def prepareArm(forceHome=False):
+    timePhase("connect", connect, dobot_port)
 
-    if "-p" in sys.argv:
+    with span("clear alarms"):
+        dType.ClearAllAlarmsState(api)
+
+    if state == dType.DobotConnect.DobotConnect_Occupied:
+        return None
+
+    with span("reset queue"):
+        dType.SetQueuedCmdClear(api)
+        dType.ClearAllAlarmsState(api)
+        executeQueue([PumpOff()])
+
+    # With -s homing is skipped while the saved arm state checks out
+    armKey = None
+    armState = None
+    homing = options.home or forceHome
+    if options.skip_homing:
+        armKey = armstate.armKey(api, dobot_port)
+        armState = armstate.loadState(armKey)
+
+        reason = None if homing else timePhase("validate arm", armstate.homingReason, api, armState)
+        if reason is not None:
+            print("Homing needed:", reason)
+            homing = True
+        elif not homing:
+            print("Saved arm state checks out, skipping homing")
+
+    if homing:
+        if not timePhase("home", homeRobot):
+            dType.DisconnectDobot(api)
+            return None
+
+        if armKey is not None:
+            armstate.markHomed(api, armKey)
+            armState = armstate.loadState(armKey)
+
+    if armKey is not None:
+        armstate.markJobStarted(armKey, armState)
+
+    if options.pam:
         print("Spraying the PAM...")
-        executeQueue([PAM()])
+        timePhase("pam", executeQueue, compiler.compileMacro([PAM()]))
 
-    try:
-        # grab last command line argument for filename
-        commands = load_gcode_commands(sys.argv[-1])
+    return armKey, armState
+
+# Progress through the print is saved to saved, a checkpoint.Checkpoint,
+# until the print finishes
+def printJob(commands, armKey, armState, saved):
+    from tqdm import tqdm
+    import turtle
 
-        # showPlot(commands)
+    commandPlot = timePhase("preview", PancakePlot, commands)
+
+    recorder = None
+    if options.telemetry:
+        import telemetry
+        recorder = telemetry.PoseRecorder(api, options.telemetry, options.rate)
+        recorder.start()
+
+    startWatchdog()
+
+    metrics.jobs.value += 1
+    jobStart = time.time()
+    finished = False
+
+    try:
         print("Printing Pancake...")
-        executeQueue(commands, plot=True)
+        queueIndices = []
+        starved = starvation.StarvationDetector()
+        try:
+            timePhase("print", executeQueue, commands, commandPlot, queueIndices, saved.update, starved)
+        finally:
+            starved.finish()
+        starved.report()
+        checkpoint.clear()
+
+        if recorder is not None:
+            telemetry.saveQueueIndices(options.telemetry, queueIndices)
 
         # Park robot out of way griddle
-        executeQueue([Move(100-200, -150-25, 100)])
+        with span("park"):
+            executeQueue(compiler.compilePark(Move(100-200, -150-25, 100), compiler.endPosition(commands)))
 
         print("Pancake Cook Time: 1.75 minutes")
-        for i in tqdm(range(int(60*1.75))):
-            time.sleep(1)
+        with span("cook"):
+            for i in tqdm(range(int(60*1.75))):
+                checkAlarms()
+                time.sleep(1)
 
         print("Pancake Done! Flipping Now...") 
-        executeQueue([UR3()])
+        timePhase("flip", executeQueue, compiler.compileMacro([UR3()]))
 
         # Park robot out of way griddle
-        executeQueue([Move(100-200, -150-25, 100)])
-        
-        # close all turtle windows
-        turtle.bye()
+        with span("park"):
+            executeQueue(compiler.compilePark(Move(100-200, -150-25, 100), compiler.endPosition([UR3()])))
+        finished = True
+
+    finally:
+        stopWatchdog()
+
+        if finished:
+            metrics.last_job_seconds.value = time.time() - jobStart
+            metrics.job_seconds.value += metrics.last_job_seconds.value
+        else:
+            metrics.job_aborts.value += 1
+            if jobTimeline is not None:
+                jobTimeline.instant("aborted")
+
+        if recorder is not None:
+            recorder.stop()
+            print("Recorded", recorder.written, "pose samples to", options.telemetry)
+            if recorder.error is not None:
+                print("Pose recording stopped early:", recorder.error)
+
+    if armKey is not None:
+        armstate.markJobFinished(api, armKey, armState)
+
+    # close all turtle windows
+    turtle.bye()
+
+def startWatchdog():
+    global jobWatchdog
+
+    jobWatchdog = watchdog.AlarmWatchdog(api, options.alarm_interval)
+    jobWatchdog.start()
+
+def stopWatchdog():
+    global jobWatchdog
+
+    if jobWatchdog is not None:
+        jobWatchdog.stop()
+        jobWatchdog = None
+
+# Nothing was printed, so the arm can be trusted as much as before the
+# job. If spraying the PAM moved it, the saved pose no longer matches and
+# the next job homes anyway.
+def refuseJob(armKey, armState):
+    if armKey is not None:
+        armstate.saveState(armKey, armState)
+
+# Stop the arm and turn the pump off after losing track of its queue,
+# the commands already queued on it would otherwise keep running
+def stopArm():
+    from dobot.DobotSerial import DobotSerialError
+
+    try:
+        watchdog.abort(api)
+    except DobotSerialError as e:
+        print("Could not stop the dobot, switch it off:", e)
+
+def printCommand():
+    import threading
+    from watchdog import AlarmError
+    from dobot.DobotSerial import DobotSerialError
+
+    if options.instrument:
+        from dobot import DobotInstrument
+        DobotInstrument.enable()
+
+    loadApi()
+    start = time.time()
+
+    # Parse and compile the GCODE on a worker thread while the arm homes
+    # and sprays. All Dobot calls and the turtle preview stay on this
+    # thread.
+    job = {}
+    jobThread = threading.Thread(target=prepareJob, args=(options.file, job))
+    jobThread.start()
+
+    armKey = None
+    armState = None
+    try:
+        try:
+            arm = timePhase("prepare arm", prepareArm)
+        finally:
+            jobThread.join()
+
+        if arm is None:
+            return
+        armKey, armState = arm
+
+        if "error" in job:
+            raise job["error"]
+
+        if job["valid"]:
+            print("Ready to print after %.2f seconds" % (time.time() - start))
+            printJob(job["commands"], armKey, armState, checkpoint.Checkpoint(options.file, len(job["commands"])))
+        else:
+            print("Pancake does not fit in the range of the dobot, not printing")
+            refuseJob(armKey, armState)
 
-    except IndexError:
-        print("Please provide a file to print!")
-        
     except FileNotFoundError:
         print("Inputted file was not found")
-    
+        refuseJob(armKey, armState)
+
+    except AlarmError as e:
+        # The arm was stopped mid job, its saved state stays untrusted
+        # so the next job homes first
+        print("Print aborted, arm alarm:", e)
+
+    except DobotSerialError as e:
+        print("Print aborted, lost track of the dobot's queue:", e)
+        stopArm()
+
+    dType.DisconnectDobot(api)
+
+    if options.instrument:
+        DobotInstrument.report()
+
+# Continue an interrupted print of the file after the last command the
+# arm confirmed executing
+def resumeCommand():
+    from watchdog import AlarmError
+    from dobot.DobotSerial import DobotSerialError
+
+    if options.instrument:
+        from dobot import DobotInstrument
+        DobotInstrument.enable()
+
+    saved = checkpoint.find(options.file)
+    if saved is None:
+        print("No interrupted print of", options.file, "to resume")
+        return
+
+    commands = compiler.compile(load_gcode_commands(options.file))
+    if len(commands) != saved["commands"]:
+        print("The file or compiler settings changed since the print was interrupted, not resuming")
+        return
+
+    # The arm may have lost its position when the print stopped, so home
+    # unless -s finds the saved arm state still good
+    loadApi()
+    try:
+        arm = timePhase("prepare arm", prepareArm, not options.skip_homing)
+        if arm is None:
+            return
+        armKey, armState = arm
+
+        resumed, lead = compiler.compileResume(commands, saved["done"], dType.GetPose(api))
+        print("Resuming after command", saved["done"], "of", len(commands))
+
+        printJob(resumed, armKey, armState, checkpoint.Checkpoint(options.file, len(commands), saved["done"], lead))
+    except AlarmError as e:
+        print("Print aborted, arm alarm:", e)
+
+    except DobotSerialError as e:
+        print("Print aborted, lost track of the dobot's queue:", e)
+        stopArm()
 
     dType.DisconnectDobot(api)
 
-main()
+    if options.instrument:
+        DobotInstrument.report()
+
+# Parse, compile and validate without touching the arm
+def compileCommand():
+    stats = {}
+    commands = compiler.compile(load_gcode_commands(options.file), stats)
+    compiler.printPeephole(stats)
+
+    if options.verbose:
+        for c in commands:
+            print(c)
+
+    problems, closest = compiler.checkReach(commands)
+    compiler.printReach(commands, problems, closest)
+
+    print("Compiled into", len(commands), "commands,", "ready to print" if not problems else "NOT printable")
+
+def previewCommand():
+    import turtle
+
+    commands = compiler.compile(load_gcode_commands(options.file))
+    PancakePlot(commands)
+    turtle.done()
+
+def estimateCommand():
+    import simulator
+
+    commands = compiler.compile(load_gcode_commands(options.file))
+    print("Estimated print time: %.1f seconds" % simulator.estimateTime(commands))
+
+subcommands = {
+    "print": printCommand,
+    "resume": resumeCommand,
+    "compile": compileCommand,
+    "preview": previewCommand,
+    "estimate": estimateCommand,
+}
+
+options = None
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Print Pancake Painter GCODE on a Dobot Magician", add_help=False)
+    parser.add_argument("--help", action="help", help="show this help message and exit")
+    parser.add_argument("command", choices=list(subcommands))
+    parser.add_argument("file", help="GCODE file from Pancake Painter")
+    parser.add_argument("--port", default=dobot_port, help="serial port the dobot is on (default %(default)s)")
+    parser.add_argument("--backend", choices=["dll", "serial"], default="dll", help="talk to the dobot through the vendor DLL or directly over serial")
+    parser.add_argument("--record", metavar="TRACE", help="record every Dobot API call to a trace file")
+    parser.add_argument("--replay", metavar="TRACE", help="answer Dobot API calls from a recorded trace instead of the arm")
+    parser.add_argument("-h", "--home", action="store_true", help="home the arm before printing")
+    parser.add_argument("-s", "--skip-homing", action="store_true", help="only home when the saved arm state fails validation")
+    parser.add_argument("-p", "--pam", action="store_true", help="spray PAM before printing")
+    parser.add_argument("-i", "--instrument", action="store_true", help="time every Dobot API call")
+    parser.add_argument("-t", "--telemetry", metavar="LOG", help="record the arm pose to a binary log while printing")
+    parser.add_argument("--rate", type=float, default=20, help="pose samples per second for --telemetry")
+    parser.add_argument("--alarm-interval", type=float, default=0.5, help="seconds between alarm checks while printing")
+    parser.add_argument("-f", "--flow", action="store_true", help="set the pump flow through PWM to match the drawing speed")
+    parser.add_argument("--fixed-poll", action="store_true", help="poll the queue at a fixed interval instead of sleeping until each chunk is predicted to finish")
+    parser.add_argument("--timeline", metavar="JSON", help="write a Chrome trace event timeline of the job phases and chunks")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this local HTTP port")
+    parser.add_argument("--metrics-file", metavar="PROM", help="write Prometheus metrics to this textfile for node_exporter")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list the compiled commands")
+
+    # The old "main.py [-h] [-p] file" form still prints
+    if len(argv) > 0 and argv[0] not in subcommands and argv[0] != "--help":
+        argv = ["print"] + argv
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global options, dobot_port, jobTimeline, predicted_wait
+
+    options = parseArgs(sys.argv[1:] if argv is None else argv)
+    dobot_port = options.port
+    compiler.flow_control = options.flow
+    predicted_wait = not options.fixed_poll
+
+    if options.metrics_port or options.metrics_file:
+        from dobot import DobotInstrument
+        DobotInstrument.hooks.append(metrics.countCall)
+
+    if options.metrics_port:
+        metrics.serve(options.metrics_port)
+    exporter = metrics.exportTextfile(options.metrics_file) if options.metrics_file else None
+
+    if options.timeline:
+        import timeline
+        jobTimeline = timeline.Timeline()
+
+    try:
+        subcommands[options.command]()
+    finally:
+        if exporter is not None:
+            exporter.set()
+            exporter.thread.join()
+
+        if jobTimeline is not None:
+            jobTimeline.save(options.timeline)
+            print("Wrote timeline to", options.timeline)
+
+if __name__ == "__main__":
+    main()
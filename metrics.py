@@ -0,0 +1,120 @@
+import threading
+import os
+
+# Counters and gauges for monitoring printers, exported in the Prometheus
+# text format over HTTP or to a textfile for node_exporter. Every metric
+# and label combination is created up front or on first use, after that
+# updating one is a single attribute increment.
+
+families = []
+
+class Sample:
+    __slots__ = ("labels", "value")
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.value = 0
+
+class Metric:
+    def __init__(self, name, kind, help, labelNames=()):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelNames = labelNames
+        self.children = {}
+        self.value = 0
+        families.append(self)
+
+    # Sample for one combination of label values, kept for reuse
+    def child(self, *values):
+        sample = self.children.get(values)
+        if sample is None:
+            labels = ",".join('%s="%s"' % (n, str(v).replace('"', '\\"')) for n, v in zip(self.labelNames, values))
+            sample = self.children[values] = Sample(labels)
+        return sample
+
+    def lines(self):
+        yield "# HELP %s %s" % (self.name, self.help)
+        yield "# TYPE %s %s" % (self.name, self.kind)
+
+        if not self.labelNames:
+            yield "%s %s" % (self.name, formatValue(self.value))
+        for sample in list(self.children.values()):
+            yield "%s{%s} %s" % (self.name, sample.labels, formatValue(sample.value))
+
+def formatValue(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+commands_queued = Metric("dobot_commands_queued_total", "counter", "Commands sent to the arm's queue")
+chunks = Metric("dobot_chunks_total", "counter", "Chunks of commands executed")
+queue_depth = Metric("dobot_queue_depth", "gauge", "Commands queued on the arm that have not run yet")
+queue_index = Metric("dobot_queue_current_index", "gauge", "Queue index the arm last reported")
+queue_polls = Metric("dobot_queue_polls_total", "counter", "Queue index polls while waiting for chunks to run")
+completions = Metric("dobot_chunk_completions_total", "counter", "Chunks that were still running at the first poll")
+completion_latency = Metric("dobot_chunk_completion_latency_seconds_total", "counter", "Longest time those chunks could have finished before a poll noticed")
+prediction_scale = Metric("dobot_prediction_scale", "gauge", "Run time of chunks over the motion model's estimate, smoothed")
+prediction_scale.value = 1
+starvations = Metric("dobot_queue_starvations_total", "counter", "Times the arm's queue ran empty with commands left to send")
+starved_seconds = Metric("dobot_queue_starved_seconds_total", "counter", "Time the arm's queue stood empty with commands left to send, midway between the shortest and longest it could have been")
+api_calls = Metric("dobot_api_calls_total", "counter", "Raw Dobot API calls", ("call",))
+api_retries = Metric("dobot_api_retries_total", "counter", "Raw Dobot API calls that failed and were retried", ("call",))
+jobs = Metric("dobot_jobs_total", "counter", "Print jobs started")
+job_aborts = Metric("dobot_job_aborts_total", "counter", "Print jobs aborted")
+job_seconds = Metric("dobot_job_seconds_total", "counter", "Time spent in finished print jobs")
+last_job_seconds = Metric("dobot_last_job_seconds", "gauge", "Duration of the last finished print job")
+phase_seconds = Metric("dobot_phase_seconds", "gauge", "Duration of the last run of each job phase", ("phase",))
+
+def render():
+    lines = []
+    for family in families:
+        lines.extend(family.lines())
+
+    return "\n".join(lines) + "\n"
+
+# DobotInstrument hook counting raw calls and failed ones. The
+# DobotDllType wrappers retry every failed call, so each failure is one
+# retry. ConnectDobot returns the connection state and is never retried.
+def countCall(name, result):
+    api_calls.child(name).value += 1
+    if result and name != "ConnectDobot":
+        api_retries.child(name).value += 1
+
+def serve(port, host="127.0.0.1"):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def writeTextfile(filename):
+    with open(filename + ".tmp", "w") as f:
+        f.write(render())
+    os.replace(filename + ".tmp", filename)
+
+# Rewrite the textfile every `interval` seconds until the returned event
+# is set, then once more
+def exportTextfile(filename, interval=5):
+    stopping = threading.Event()
+
+    def run():
+        while not stopping.wait(interval):
+            writeTextfile(filename)
+        writeTextfile(filename)
+
+    stopping.thread = threading.Thread(target=run, daemon=True)
+    stopping.thread.start()
+    return stopping
@@ -0,0 +1,195 @@
+from dobot import DobotDllType as dType
+import math
+import sys
+
+from commands import *
+import kinematics
+import compiler
+
+# Motion model of the Magician running PTP moves. Every PTP move starts
+# and ends at rest, so each one follows a trapezoidal (or triangular)
+# velocity profile.
+ptp_velocity = default_velocity
+ptp_acceleration = default_acceleration
+command_overhead = 0.01 # s, controller time to pick up a queued command
+
+def moveTime(distance, velocity=ptp_velocity, acceleration=ptp_acceleration):
+    if distance <= 0:
+        return 0
+
+    # Distance needed to reach full speed and slow back down
+    rampDistance = velocity * velocity / acceleration
+
+    if distance < rampDistance:
+        return 2 * math.sqrt(distance / acceleration)
+
+    return 2 * velocity / acceleration + (distance - rampDistance) / velocity
+
+# Time for a MOVJ, every joint starts and stops together so the joint
+# with the longest move sets the time
+def jointMoveTime(start, end, velocity=joint_velocity, acceleration=joint_acceleration):
+    a = kinematics.inverse(*start)
+    b = kinematics.inverse(*end)
+    if a is None or b is None:
+        return moveTime(distance(start, end))
+
+    return max(moveTime(abs(b[j] - a[j]), velocity, acceleration) for j in range(3))
+
+def distance(a, b):
+    return math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2 + (a[2] - b[2])**2)
+
+# Estimated time (s) the arm spends on each command of a list
+def commandTimes(commands, start=None):
+    position = start
+    velocity = ptp_velocity
+    acceleration = ptp_acceleration
+    jointSpeed = (joint_velocity, joint_acceleration)
+    ratio = (1, 1)
+    times = []
+
+    for c in commands:
+        total = command_overhead
+
+        if type(c) == Move:
+            target = (c.x, c.y, c.z)
+            if position is not None and c.mode == dType.PTPMode.PTPMOVJXYZMode:
+                total += jointMoveTime(position, target, jointSpeed[0] * ratio[0], jointSpeed[1] * ratio[1])
+            elif position is not None:
+                total += moveTime(distance(position, target), velocity * ratio[0], acceleration * ratio[1])
+            position = target
+
+        elif type(c) == Jump:
+            target = (c.x, c.y, c.z)
+            if position is not None:
+                top = min(max(position[2], c.z) + c.height, c.zLimit)
+                v = velocity * ratio[0]
+                a = acceleration * ratio[1]
+                total += moveTime(max(top - position[2], 0), v, a)
+                total += moveTime(distance((position[0], position[1], top), (c.x, c.y, top)), v, a)
+                total += moveTime(max(top - c.z, 0), v, a)
+            position = target
+
+        elif isinstance(c, Macro):
+            total += estimateTime(c.commands(), position) - command_overhead
+            if c.steps:
+                position = [s for s in c.steps if type(s) == tuple][-1]
+
+        elif type(c) == Feedrate:
+            velocity = c.velocity
+            acceleration = c.acceleration
+
+        elif type(c) == JointSpeed:
+            jointSpeed = (c.velocity, c.acceleration)
+
+        elif type(c) == SpeedRatio:
+            ratio = (c.velocity / 100, c.acceleration / 100)
+
+        elif type(c) == Wait:
+            total += c.ms / 1000
+
+        times.append(total)
+
+    return times
+
+# Estimate how long the arm needs to run a command list, in seconds
+def estimateTime(commands, start=None):
+    return sum(commandTimes(commands, start))
+
+# Compare the estimated print time of designs before and after compiling
+def compareDesigns(filenames):
+    import main
+
+    totalBefore = 0
+    totalAfter = 0
+
+    for filename in filenames:
+        commands = main.load_gcode_commands(filename)
+        before = estimateTime(commands)
+        after = estimateTime(compiler.compile(commands))
+        totalBefore += before
+        totalAfter += after
+
+        print("%s: %.1fs -> %.1fs (saved %.1fs)" % (filename, before, after, before - after))
+
+    print("Total: %.1fs -> %.1fs (saved %.1fs)" % (totalBefore, totalAfter, totalBefore - totalAfter))
+
+# Time spent on moves made with the pump off
+def travelTime(commands, start=None):
+    pumpOn = False
+    total = 0
+
+    for c, t in zip(commands, commandTimes(commands, start)):
+        if type(c) == PumpOn:
+            pumpOn = True
+        elif type(c) == PumpOff or type(c) == PumpDisable:
+            pumpOn = False
+        elif (type(c) == Move or type(c) == Jump) and not pumpOn:
+            total += t
+
+    return total
+
+# Time spent on pump off travel moves, run as MOVL and as MOVJ
+def compareTravelModes(filenames):
+    import main
+
+    lead = (compiler.pump_lead, compiler.pump_stop_lead)
+    totalLinear = 0
+    totalJoint = 0
+
+    for filename in filenames:
+        commands = main.load_gcode_commands(filename)
+
+        # Switching the pump during travel would count some of it as drawing
+        compiler.pump_lead, compiler.pump_stop_lead = 0, 0
+        compiler.joint_travel = False
+        linear = travelTime(compiler.compile(commands))
+        compiler.joint_travel = True
+        joint = travelTime(compiler.compile(commands))
+        compiler.pump_lead, compiler.pump_stop_lead = lead
+
+        totalLinear += linear
+        totalJoint += joint
+
+        print("%s: MOVL travel %.1fs, MOVJ travel %.1fs (saved %.1fs)" % (filename, linear, joint, linear - joint))
+
+    print("Total: MOVL travel %.1fs, MOVJ travel %.1fs (saved %.1fs)" % (totalLinear, totalJoint, totalLinear - totalJoint))
+
+# Print time with the pump switched during motion and with the dwells
+# from the GCODE
+def dwellTime(commands):
+    return sum(c.ms for c in commands if type(c) == Wait) / 1000
+
+def comparePumpScheduling(filenames):
+    import main
+
+    lead = (compiler.pump_lead, compiler.pump_stop_lead)
+    totalDwell = 0
+    totalOverlap = 0
+
+    for filename in filenames:
+        commands = main.load_gcode_commands(filename)
+
+        compiler.pump_lead, compiler.pump_stop_lead = 0, 0
+        standing = compiler.compile(commands)
+        compiler.pump_lead, compiler.pump_stop_lead = lead
+        moving = compiler.compile(commands)
+
+        dwell = estimateTime(standing)
+        overlap = estimateTime(moving)
+        totalDwell += dwell
+        totalOverlap += overlap
+
+        # Only whole moves that fit in the lead are overlapped, designs
+        # without short moves around their strokes gain nothing
+        print("%s: pump dwells %.1fs, overlapped %.1fs (saved %.1fs, dwells cut from %.1fs to %.1fs)" % (
+            filename, dwell, overlap, dwell - overlap, dwellTime(standing), dwellTime(moving)))
+
+    print("Total: pump dwells %.1fs, overlapped %.1fs (saved %.1fs)" % (totalDwell, totalOverlap, totalDwell - totalOverlap))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--travel-modes":
+        compareTravelModes(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "--pump-schedule":
+        comparePumpScheduling(sys.argv[2:])
+    else:
+        compareDesigns(sys.argv[1:])
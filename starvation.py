@@ -0,0 +1,54 @@
+import time
+
+import metrics
+
+# Watches the last queue index sent to the arm against the one it reports
+# executing, and records the intervals where the arm's queue was empty
+# while the program still had commands to send, i.e. the arm stood idle
+# waiting for the host. The queue ran empty somewhere between the last
+# poll that found it busy and the one that found it empty, so each
+# interval is kept as its shortest and longest possible length.
+class StarvationDetector:
+    def __init__(self):
+        self.intervals = []
+        self.started = time.perf_counter()
+        self.lastBusy = self.started
+        self.emptySince = None
+        self.finished = None
+
+    # Called after every poll with the queue index the arm reported and
+    # how many program commands are still to be sent
+    def update(self, sentIndex, currentIndex, remaining):
+        if currentIndex >= sentIndex and remaining > 0:
+            if self.emptySince is None:
+                self.emptySince = time.perf_counter()
+        else:
+            self.refilled()
+
+    # Called once more commands are queued and the queue is running again
+    def refilled(self):
+        now = time.perf_counter()
+        if self.emptySince is not None:
+            shortest = now - self.emptySince
+            longest = now - self.lastBusy
+            self.intervals.append((self.emptySince - self.started, shortest, longest))
+            self.emptySince = None
+
+            metrics.starvations.value += 1
+            metrics.starved_seconds.value += (shortest + longest) / 2
+
+        self.lastBusy = now
+
+    def finish(self):
+        self.refilled()
+        self.finished = time.perf_counter()
+
+    # Shortest and longest total time the arm could have stood idle
+    def total(self):
+        return sum(i[1] for i in self.intervals), sum(i[2] for i in self.intervals)
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        shortest, longest = self.total()
+        print("Arm queue ran empty %d times with commands left to send, idle for %.2f to %.2f seconds of %.2f" % (
+            len(self.intervals), shortest, longest, elapsed))
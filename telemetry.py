@@ -0,0 +1,137 @@
+from dobot import DobotDllType as dType
+from dobot import DobotLock
+import numpy as np
+import threading
+import time
+
+# One pose sample: wall clock time, current queue index and the pose as
+# returned by GetPose (x, y, z, r and the four joint angles)
+sample_type = np.dtype([("time", "<f8"), ("index", "<u8"), ("pose", "<f4", (8,))])
+
+# Log files are a short header followed by raw samples
+log_magic = b"DPTL"
+log_version = 1
+header_type = np.dtype([("magic", "S4"), ("version", "<u4"), ("sampleSize", "<u4")])
+
+# Samples GetPose and the queue index at a fixed rate on a background
+# thread into a preallocated ring buffer, appending new samples to a
+# binary log file every flush_interval seconds. The sampler only reads
+# from the arm, between the calls queueing commands (see DobotLock). If a
+# read fails, sampling stops and the error is kept in `error`.
+class PoseRecorder:
+    def __init__(self, api, filename, rate=20, capacity=4096, flush_interval=1.0):
+        self.api = api
+        self.filename = filename
+        self.rate = rate
+        self.flush_interval = flush_interval
+
+        self.buffer = np.zeros(capacity, dtype=sample_type)
+        self.written = 0   # samples taken since start
+        self.flushed = 0   # samples written to the log
+        self.dropped = 0   # samples overwritten before they were flushed
+        self.error = None
+
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.file = None
+
+    def start(self):
+        self.file = open(self.filename, "wb")
+        header = np.zeros(1, dtype=header_type)
+        header[0] = (log_magic, log_version, sample_type.itemsize)
+        self.file.write(header.tobytes())
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        self.file.close()
+
+    def run(self):
+        period = 1 / self.rate
+        nextSample = time.perf_counter()
+        lastFlush = nextSample
+
+        while not self.stopping.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                self.error = e
+                return
+
+            now = time.perf_counter()
+            if now - lastFlush >= self.flush_interval:
+                self.flush()
+                lastFlush = now
+
+            nextSample += period
+            delay = nextSample - time.perf_counter()
+            if delay > 0:
+                self.stopping.wait(delay)
+            else:
+                # Running behind, don't try to catch up with a burst
+                nextSample = time.perf_counter()
+
+    def sample(self):
+        # Keep the pose and index from the same moment
+        with DobotLock.lock:
+            pose = dType.GetPose(self.api)
+            index = dType.GetQueuedCmdCurrentIndex(self.api)[0]
+
+        with self.lock:
+            self.buffer[self.written % len(self.buffer)] = (time.time(), index, pose)
+            self.written += 1
+
+    def flush(self):
+        with self.lock:
+            start = self.flushed
+            end = self.written
+
+            # Anything older than one buffer length has been overwritten
+            if end - start > len(self.buffer):
+                self.dropped += end - start - len(self.buffer)
+                start = end - len(self.buffer)
+
+            samples = self.recent(end - start)
+            self.flushed = end
+
+        if len(samples) > 0:
+            self.file.write(samples.tobytes())
+            self.file.flush()
+
+    # Copy of the last n samples, oldest first. Call with the lock held
+    # or use latest().
+    def recent(self, n):
+        n = min(n, self.written, len(self.buffer))
+        start = (self.written - n) % len(self.buffer)
+        end = start + n
+
+        if end <= len(self.buffer):
+            return self.buffer[start:end].copy()
+        return np.concatenate((self.buffer[start:], self.buffer[:end - len(self.buffer)]))
+
+    def latest(self, n=1):
+        with self.lock:
+            return self.recent(n)
+
+def readLog(filename):
+    header = np.fromfile(filename, dtype=header_type, count=1)
+    if len(header) == 0 or header[0]["magic"] != log_magic:
+        raise ValueError(filename + " is not a pose log")
+    if header[0]["sampleSize"] != sample_type.itemsize:
+        raise ValueError(filename + " has an unsupported sample format")
+
+    return np.fromfile(filename, dtype=sample_type, offset=header_type.itemsize)
+
+# Queue index of every command of the printed program, so samples can
+# be matched to the command the arm was running
+def saveQueueIndices(filename, queueIndices):
+    np.save(filename + ".index.npy", np.array(queueIndices, dtype="<u8"))
+
+def loadQueueIndices(filename):
+    return np.load(filename + ".index.npy")
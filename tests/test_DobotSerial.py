@@ -0,0 +1,116 @@
+from ctypes import *
+import unittest
+
+from dobot import DobotDllType as dType
+from dobot.DobotSerial import DobotSerialError, PacketReader, SerialDll, decode, packet
+
+# Collects what SerialDll writes instead of a serial port
+class Port:
+    def __init__(self):
+        self.written = bytearray()
+
+    def write(self, data):
+        self.written += data
+
+# Answers every immediate packet written, like the controller would
+class AnsweringPort(Port):
+    def __init__(self, dll):
+        super().__init__()
+        self.dll = dll
+        self.reader = PacketReader()
+
+    def write(self, data):
+        super().write(data)
+        for id, ctrl, params in self.reader.feed(data):
+            if not ctrl & 2:
+                self.dll.received(id, b"")
+
+class PacketTest(unittest.TestCase):
+    def test_round_trip(self):
+        reader = PacketReader()
+        data = packet(84, True, True, b"\x01\x02\x03") + packet(246, False, False)
+
+        self.assertEqual(reader.feed(data), [(84, 3, b"\x01\x02\x03"), (246, 0, b"")])
+        self.assertEqual(reader.dropped, 0)
+
+    def test_split_across_reads(self):
+        reader = PacketReader()
+        data = packet(10, False, False, bytes(range(32)))
+
+        self.assertEqual(reader.feed(data[:5]), [])
+        self.assertEqual(reader.feed(data[5:]), [(10, 0, bytes(range(32)))])
+
+    def test_bad_checksum_resyncs(self):
+        reader = PacketReader()
+        bad = bytearray(packet(84, True, True, b"\x01\x02\x03"))
+        bad[-1] ^= 0xFF
+
+        self.assertEqual(reader.feed(b"\x00\x55" + bytes(bad) + packet(246, False, False)), [(246, 0, b"")])
+        self.assertEqual(reader.dropped, 1)
+
+class DecodeTest(unittest.TestCase):
+    def test_alarms_state(self):
+        alarms = create_string_buffer(1000)
+        length = c_int(0)
+        response = bytes([0x01] + [0] * 14 + [0x80])
+
+        decode(response, (alarms, byref(length), 1000))
+
+        self.assertEqual(length.value, 16)
+        self.assertEqual(alarms.raw[:16], response)
+
+    def test_structure(self):
+        pose = dType.Pose()
+        decode(bytes((c_float * 8)(1, 2, 3, 4, 5, 6, 7, 8)), (byref(pose),))
+
+        self.assertEqual((pose.x, pose.y, pose.z, pose.joint4Angle), (1, 2, 3, 8))
+
+class QueueIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dll = SerialDll()
+        self.dll.port = Port()
+        self.dll.nextIndex = 10
+        self.dll.credits = 5
+
+    def queueWait(self, ms):
+        index = c_uint64(0)
+        result = self.dll.SetWAITCmd(c_int(0), c_int(0), byref(dType.WAITCmd(ms)), 1, byref(index))
+        self.assertEqual(result, dType.DobotCommunicate.DobotCommunicate_NoError)
+        return index.value
+
+    def test_predicts_indices(self):
+        self.assertEqual([self.queueWait(100), self.queueWait(200)], [10, 11])
+
+        self.dll.flush()
+        self.assertEqual(bytes(self.dll.port.written),
+            packet(110, True, True, bytes(dType.WAITCmd(100))) + packet(110, True, True, bytes(dType.WAITCmd(200))))
+
+        self.dll.received(110, (10).to_bytes(8, "little"))
+        self.dll.received(110, (11).to_bytes(8, "little"))
+        self.assertIsNone(self.dll.error)
+        self.assertEqual(len(self.dll.expected), 0)
+
+    def test_mismatched_ack_fails(self):
+        self.queueWait(100)
+        self.dll.received(110, (12).to_bytes(8, "little"))
+
+        self.assertIsInstance(self.dll.error, DobotSerialError)
+        self.assertIsNone(self.dll.nextIndex)
+        with self.assertRaises(DobotSerialError):
+            self.queueWait(100)
+
+    def test_stop_after_failure(self):
+        self.dll.port = AnsweringPort(self.dll)
+        self.queueWait(100)
+        self.dll.received(110, (12).to_bytes(8, "little"))
+
+        self.assertEqual(self.dll.SetQueuedCmdForceStopExec(c_int(0), c_int(0)), dType.DobotCommunicate.DobotCommunicate_NoError)
+        # The queued command behind the lost one is never written
+        self.assertEqual(bytes(self.dll.port.written), packet(242, True, False))
+
+    def test_unsupported_call(self):
+        with self.assertRaises(AttributeError):
+            self.dll.SetArmOrientation
+
+if __name__ == "__main__":
+    unittest.main()
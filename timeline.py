@@ -0,0 +1,52 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Spans of a job in the Chrome trace event format, for opening in
+# chrome://tracing or Perfetto. Each thread gets its own track.
+class Timeline:
+    def __init__(self):
+        self.events = []
+        self.threads = set()
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.started = time.perf_counter()
+
+    # Microseconds since the timeline started
+    def now(self):
+        return (time.perf_counter() - self.started) * 1e6
+
+    # Record the time spent in the with block as a span, args are shown
+    # with it in the viewer
+    @contextlib.contextmanager
+    def span(self, name, category="job", **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add({"name": name, "cat": category, "ph": "X", "ts": round(start, 1), "dur": round(self.now() - start, 1)}, args)
+
+    def instant(self, name, category="job", **args):
+        self.add({"name": name, "cat": category, "ph": "i", "s": "t", "ts": round(self.now(), 1)}, args)
+
+    def add(self, event, args):
+        thread = threading.current_thread()
+        event["pid"] = self.pid
+        event["tid"] = thread.ident
+        if args:
+            event["args"] = args
+
+        with self.lock:
+            if thread.ident not in self.threads:
+                self.threads.add(thread.ident)
+                self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread.ident, "args": {"name": thread.name}})
+            self.events.append(event)
+
+    def save(self, filename):
+        with self.lock:
+            events = list(self.events)
+
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,120 @@
+from dobot import DobotDllType as dType
+from dobot import DobotLock
+import threading
+
+# Alarm IDs from the Dobot Magician communication protocol. Each alarm is
+# one bit of the state returned by GetAlarmsState, bit n of byte m being
+# alarm m*8 + n.
+alarm_names = {
+    0x00: "reset",
+    0x01: "undefined instruction",
+    0x02: "file system error",
+    0x03: "MCU/FPGA communication failure",
+    0x04: "angle sensor reading error",
+    0x10: "planning: singularity",
+    0x11: "planning: inverse kinematics failed",
+    0x12: "planning: point out of joint limits",
+    0x13: "planning: repeated data",
+    0x14: "planning: bad arc parameters",
+    0x15: "planning: bad JUMP parameters",
+    0x20: "motion: singularity",
+    0x21: "motion: inverse kinematics failed",
+    0x22: "motion: point out of joint limits",
+    0x30: "joint 1 overspeed",
+    0x31: "joint 2 overspeed",
+    0x32: "joint 3 overspeed",
+    0x33: "joint 4 overspeed",
+    0x40: "joint 1 positive limit",
+    0x41: "joint 1 negative limit",
+    0x42: "joint 2 positive limit",
+    0x43: "joint 2 negative limit",
+    0x44: "joint 3 positive limit",
+    0x45: "joint 3 negative limit",
+    0x46: "joint 4 positive limit",
+    0x47: "joint 4 negative limit",
+    0x50: "joint 1 lost steps",
+    0x51: "joint 2 lost steps",
+    0x52: "joint 3 lost steps",
+    0x53: "joint 4 lost steps",
+}
+
+# Alarms that don't mean the job has gone wrong
+ignored_alarms = [0x00]
+
+class AlarmError(Exception):
+    def __init__(self, alarms):
+        self.alarms = alarms
+        Exception.__init__(self, ", ".join(describe(a) for a in alarms))
+
+def describe(alarm):
+    return alarm_names.get(alarm, "alarm 0x%02x" % alarm)
+
+def decodeAlarms(raw, length):
+    alarms = []
+    for byte in range(length):
+        value = raw[byte]
+        for bit in range(8):
+            if value & (1 << bit):
+                alarms.append(byte * 8 + bit)
+
+    return alarms
+
+def activeAlarms(api):
+    raw, length = dType.GetAlarmsState(api)
+    return [a for a in decodeAlarms(raw, length) if a not in ignored_alarms]
+
+# Stop the arm straight away and turn the batter off without waiting on
+# the queue
+def abort(api):
+    dType.SetQueuedCmdForceStopExec(api)
+    dType.SetEndEffectorGripper(api, True, True, isQueued=0)
+
+# Polls the alarm state every `interval` seconds on a background thread.
+# On the first alarm the arm is stopped and the pump turned off, so an
+# alarm is acted on at most one interval (plus one API call) after it is
+# raised. check() raises AlarmError from then on. Stopping the arm and
+# tripping happen under DobotLock.lock, so a caller that checks and starts
+# the queue under the same lock never restarts it after the stop. If
+# reading the alarms fails the watchdog stops and check() raises that
+# error instead.
+class AlarmWatchdog:
+    def __init__(self, api, interval=0.5):
+        self.api = api
+        self.interval = interval
+        self.alarms = []
+        self.error = None
+        self.tripped = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                alarms = activeAlarms(self.api)
+            except Exception as e:
+                self.error = e
+                return
+
+            if alarms:
+                with DobotLock.lock:
+                    abort(self.api)
+                    self.alarms = alarms
+                    self.tripped.set()
+                return
+
+            self.stopping.wait(self.interval)
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+        if self.tripped.is_set():
+            raise AlarmError(self.alarms)